@@ -0,0 +1,78 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+# Runs one analysis function over many capture files in a process pool. The function must be defined at
+# module level (workers import it by name) and take the filename first; keyword arguments are passed to
+# every call, and file_kwargs (one dict per file) adds per-file arguments on top of them. Results come back
+# in the order of the filenames, and a file that raises is recorded with its traceback instead of stopping
+# the rest of the batch. Anything that plots must run with workers=1.
+
+
+class BatchResult:
+    def __init__(self, filename: str, value=None, error: str = None, elapsed: float = 0.0):
+        self.filename = filename
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_one(function, filename: str, kwargs: dict) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        value = function(filename, **kwargs)
+    except Exception:
+        return BatchResult(filename, error=traceback.format_exc(), elapsed=time.perf_counter() - start)
+    return BatchResult(filename, value, elapsed=time.perf_counter() - start)
+
+
+def run_batch(function, filenames: list, workers: int = None, show_report: bool = True, file_kwargs: list = None,
+              **kwargs) -> list:
+    # workers defaults to the number of cores; workers=1 runs in this process
+    start = time.perf_counter()
+    if file_kwargs is None:
+        file_kwargs = [{}] * len(filenames)
+    call_kwargs = [{**kwargs, **extra} for extra in file_kwargs]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(filenames))
+
+    if workers <= 1:
+        results = [run_one(function, filename, extra) for filename, extra in zip(filenames, call_kwargs)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_one, function, filename, extra)
+                       for filename, extra in zip(filenames, call_kwargs)]
+            results = []
+            for filename, future in zip(filenames, futures):
+                try:
+                    results.append(future.result())
+                except Exception:
+                    # the worker itself died (e.g. out of memory); only this file is lost
+                    results.append(BatchResult(filename, error=traceback.format_exc()))
+
+    if show_report:
+        print_report(function, results, time.perf_counter() - start, max(workers, 1))
+    return results
+
+
+def print_report(function, results: list, elapsed: float, workers: int):
+    failed = [result for result in results if not result.ok]
+    busy = sum(result.elapsed for result in results)
+    print(f"{function.__name__}: {len(results) - len(failed)}/{len(results)} files in {elapsed:.2f} s "
+          f"on {workers} worker(s), {busy:.2f} s of work")
+    for result in results:
+        status = "ok" if result.ok else "FAILED"
+        print(f"  {result.elapsed:7.3f} s  {status:<6} {result.filename}")
+    for result in failed:
+        print(f"\n{result.filename}:\n{result.error}")
+
+
+def batch_values(results: list, missing=float("nan")) -> list:
+    # result values in file order, with `missing` in place of files that failed
+    return [result.value if result.ok else missing for result in results]
@@ -0,0 +1,252 @@
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+from frame_schemas import frame_struct, schemas
+from timestamps import TimestampUnwrapper
+
+# Binary capture layout: fixed-size header (magic + space padded JSON) followed by raw wire frames.
+# The header has a fixed size so it can be rewritten in place when the capture is closed, and so the
+# records that follow it stay aligned for np.memmap.
+capture_extension = ".bin"
+capture_magic = b"2DOFCAP1"
+capture_header_size = 1024
+csv_export_chunk = 100000   # frames formatted per write when exporting
+part_format = "{}_{:03d}{}"   # rotated captures: name_000.bin, name_001.bin, ...
+
+
+def timestamp_fields(dtype: np.dtype) -> list:
+    return [name for name in dtype.names if dtype[name].kind in "iu"]
+
+
+def format_frames(frames: np.ndarray, timestamps: dict = None) -> str:
+    # float32 values are printed via their float64 repr, matching the original logger output.
+    # timestamps optionally replaces raw uint32 timestamp columns with their unwrapped int64 values.
+    line_format = ",".join("%d" if frames.dtype[name].kind in "iu" else "%r" for name in frames.dtype.names) + "\n"
+    if not timestamps:
+        return "".join(line_format % row for row in frames.tolist())
+    columns = [(timestamps[name] if name in timestamps else frames[name]).tolist() for name in frames.dtype.names]
+    return "".join(line_format % row for row in zip(*columns))
+
+
+def format_csv_header(dtype: np.dtype) -> str:
+    return ",".join(dtype.names) + "\n"
+
+
+def encode_header(metadata: dict) -> bytes:
+    body = json.dumps(metadata).encode("utf-8")
+    size = len(capture_magic) + len(body) + 1
+    if size > capture_header_size:
+        raise ValueError(f"Capture header is {size} bytes, limit is {capture_header_size}")
+    return capture_magic + body + b" " * (capture_header_size - size) + b"\n"
+
+
+def read_header(filename: str) -> dict:
+    with open(filename, "rb") as f:
+        header = f.read(capture_header_size)
+    if not header.startswith(capture_magic) or len(header) != capture_header_size:
+        raise ValueError(f"{filename} is not a binary capture file")
+    return json.loads(header[len(capture_magic):].decode("utf-8"))
+
+
+class CaptureWriter:
+    def __init__(self, filename: str, port: str = "", firmware_build: str = "unknown", schema: str = frame_struct,
+                 **metadata):
+        dtype = schemas[schema].dtype
+        self.filename = filename
+        self.num_frames = 0
+        self.metadata = {
+            "schema": schema,
+            "dtype": dtype.descr,
+            "record_size": dtype.itemsize,
+            "port": port,
+            "start_time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "start_time_unix": time.time(),
+            "firmware_build": firmware_build,
+            "num_frames": 0,
+        }
+        self.metadata.update(metadata)
+        self.file = open(filename, "wb")
+        self.file.write(encode_header(self.metadata))
+
+    def write(self, frames: np.ndarray, timestamps: dict = None):
+        # records stay raw wire frames; the header's timestamp_offsets unwrap them on load
+        self.file.write(frames.tobytes())
+        self.num_frames += len(frames)
+
+    def size(self) -> int:
+        return self.file.tell()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self, **metadata):
+        if self.file.closed:
+            return
+        self.metadata["num_frames"] = self.num_frames
+        self.metadata.update(metadata)
+        self.file.seek(0)
+        self.file.write(encode_header(self.metadata))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvCaptureWriter:
+    def __init__(self, filename: str, schema: str = frame_struct, **metadata):
+        self.filename = filename
+        self.num_frames = 0
+        self.file = open(filename, "w")
+        self.file.write(format_csv_header(schemas[schema].dtype))
+
+    def write(self, frames: np.ndarray, timestamps: dict = None):
+        self.file.write(format_frames(frames, timestamps))
+        self.num_frames += len(frames)
+
+    def size(self) -> int:
+        return self.file.tell()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self, **metadata):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RotatingCaptureWriter:
+    # Unwraps timestamps across writes and, when a size or time limit is given, starts a new part file once
+    # it is exceeded. Each part records the wrap offsets of its first frame so it can be unwrapped on its own.
+    def __init__(self, filename: str, rotate_bytes: int = None, rotate_seconds: float = None, **metadata):
+        self.filename = filename
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.metadata = metadata
+        self.unwrappers = {name: TimestampUnwrapper()
+                           for name in timestamp_fields(schemas[metadata.get("schema", frame_struct)].dtype)}
+        self.filenames = []
+        self.part = None
+        self.part_start_time = None
+        self.num_frames = 0
+
+    def part_filename(self) -> str:
+        if self.rotate_bytes is None and self.rotate_seconds is None:
+            return self.filename
+        root, extension = os.path.splitext(self.filename)
+        return part_format.format(root, len(self.filenames), extension)
+
+    def open_part(self, timestamp_offsets: dict):
+        filename = self.part_filename()
+        if filename.endswith(capture_extension):
+            self.part = CaptureWriter(filename, part=len(self.filenames), timestamp_offsets=timestamp_offsets,
+                                      **self.metadata)
+        else:
+            self.part = CsvCaptureWriter(filename, **self.metadata)
+        self.part_start_time = time.monotonic()
+        self.filenames.append(filename)
+
+    def rotation_due(self) -> bool:
+        if self.rotate_bytes is not None and self.part.size() >= self.rotate_bytes:
+            return True
+        return self.rotate_seconds is not None and time.monotonic() - self.part_start_time >= self.rotate_seconds
+
+    def write(self, frames: np.ndarray):
+        if not len(frames):
+            return
+        timestamps = {name: unwrapper.unwrap(frames[name]) for name, unwrapper in self.unwrappers.items()}
+
+        if self.part is not None and self.rotation_due():
+            self.part.close()
+            self.part = None
+        if self.part is None:
+            self.open_part({name: int(values[0]) - int(frames[name][0]) for name, values in timestamps.items()})
+
+        self.part.write(frames, timestamps)
+        self.num_frames += len(frames)
+
+    def flush(self):
+        if self.part is not None:
+            self.part.flush()
+
+    def close(self, **metadata):
+        if self.part is None and not self.filenames:
+            # nothing was received; still leave an (empty) capture behind
+            self.open_part({name: 0 for name in self.unwrappers})
+        if self.part is not None:
+            self.part.close(**metadata)
+            self.part = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_capture_writer(filename: str, **metadata):
+    return RotatingCaptureWriter(filename, **metadata)
+
+
+def capture_parts(filename: str) -> list:
+    # the part files of a rotated capture in order, or just filename if it was not rotated
+    if os.path.exists(filename):
+        return [filename]
+    root, extension = os.path.splitext(filename)
+    return sorted(glob.glob(glob.escape(root) + "_[0-9][0-9][0-9]" + extension))
+
+
+def read_capture(filename: str):
+    # memory-maps the records; a trailing partial frame (e.g. after a crash) is ignored
+    header = read_header(filename)
+    dtype = np.dtype([tuple(field) for field in header["dtype"]])
+    with open(filename, "rb") as f:
+        f.seek(0, 2)
+        num_frames = (f.tell() - capture_header_size) // dtype.itemsize
+    if num_frames == 0:
+        return header, np.zeros(0, dtype=dtype)
+    frames = np.memmap(filename, dtype=dtype, mode="r", offset=capture_header_size, shape=(num_frames,))
+    return header, frames
+
+
+def unwrapped_timestamps(header: dict, frames: np.ndarray, name: str) -> np.ndarray:
+    unwrapper = TimestampUnwrapper(header.get("timestamp_offsets", {}).get(name, 0))
+    return unwrapper.unwrap(frames[name])
+
+
+def export_csv(filename: str, csv_filename: str = None) -> str:
+    if csv_filename is None:
+        csv_filename = filename[:-len(capture_extension)] + ".csv"
+    header, frames = read_capture(filename)
+    offsets = header.get("timestamp_offsets", {})
+    unwrappers = {name: TimestampUnwrapper(offsets.get(name, 0)) for name in timestamp_fields(frames.dtype)}
+
+    with open(csv_filename, "w") as csvfile:
+        csvfile.write(format_csv_header(frames.dtype))
+        for start in range(0, len(frames), csv_export_chunk):
+            chunk = frames[start:start + csv_export_chunk]
+            timestamps = {name: unwrapper.unwrap(chunk[name]) for name, unwrapper in unwrappers.items()}
+            csvfile.write(format_frames(chunk, timestamps))
+
+    return csv_filename
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python capture_files.py capture.bin [output.csv]")
+        sys.exit(1)
+
+    header, frames = read_capture(sys.argv[1])
+    print(json.dumps(header, indent=2))
+    csv_filename = export_csv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Wrote {len(frames)} frames to {csv_filename}")
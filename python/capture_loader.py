@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from capture_files import capture_extension, read_capture, unwrapped_timestamps
+from frame_schemas import schema_from_columns
+
+# Shared loader for the analysis scripts. CSV logs are parsed once into wire-exact frames (uint32 timestamps,
+# float32 values) and cached next to the source as <name>.csv.npz; later loads read the sidecar instead of
+# re-parsing. Unwrapped CSV timestamps are stored as uint32 plus a per-column offset, the same way .bin
+# capture headers record timestamp_offsets, so unwrapped_timestamps() gives back the original values.
+# .bin captures are memory-mapped directly and need no sidecar.
+
+cache_suffix = ".npz"
+cache_version = 1               # bump when the sidecar layout changes
+hash_chunk = 1 << 20            # bytes read at a time when hashing a source file
+
+
+def file_digest(filename: str) -> str:
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(hash_chunk), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_csv(filename: str):
+    columns = pd.read_csv(filename, nrows=0).columns
+    schema = schema_from_columns(columns)
+    timestamp_columns = schema.timestamp_columns()
+    logged_data = pd.read_csv(filename, dtype={name: np.int64 if name in timestamp_columns else schema.dtype[name]
+                                                for name in schema.columns})
+
+    frames = np.empty(len(logged_data), dtype=schema.dtype)
+    offsets = {}
+    for name in schema.columns:
+        values = logged_data[name].to_numpy()
+        if name in timestamp_columns and len(values):
+            # keep the wrap count the CSV already carries; unwrapping adds later wraps back
+            offsets[name] = int(values[0]) - int(values[0]) % 2 ** 32
+            values = values % 2 ** 32
+        frames[name] = values
+    header = {"schema": schema.struct, "timestamp_offsets": offsets}
+    return header, frames
+
+
+def load_sidecar(cache_filename: str, stat: os.stat_result, filename: str):
+    # the sidecar is used when size and mtime match, or when only the mtime changed but the content hash did not
+    try:
+        with np.load(cache_filename, allow_pickle=False) as cached:
+            header = json.loads(str(cached["header"]))
+            key = header["source"]
+            if key["version"] != cache_version or key["size"] != stat.st_size:
+                return None
+            if key["mtime_ns"] != stat.st_mtime_ns and key["sha1"] != file_digest(filename):
+                return None
+            return header, cached["frames"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def load_capture(filename: str, use_cache: bool = True):
+    # returns (header, frames) like capture_files.read_capture for both CSV logs and .bin captures
+    if filename.endswith(capture_extension):
+        return read_capture(filename)
+
+    stat = os.stat(filename)
+    cache_filename = filename + cache_suffix
+    if use_cache and os.path.exists(cache_filename):
+        cached = load_sidecar(cache_filename, stat, filename)
+        if cached is not None:
+            return cached
+
+    header, frames = parse_csv(filename)
+    if use_cache:
+        header["source"] = {"version": cache_version, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                            "sha1": file_digest(filename)}
+        temporary_filename = cache_filename + ".tmp.npz"
+        try:
+            np.savez(temporary_filename, frames=frames, header=np.array(json.dumps(header)))
+            os.replace(temporary_filename, cache_filename)
+        except OSError:
+            # read-only data directory; still return the parsed frames
+            pass
+    return header, frames
+
+
+def read_data(filename: str, relative_time: bool = True, force_sign: float = 1.0):
+    # position and force timestamps in seconds (float64, unwrapped) and the float32 position / force columns
+    header, frames = load_capture(filename)
+    position_timestamps = unwrapped_timestamps(header, frames, "position_timestamp") / 1e6
+    force_timestamps = unwrapped_timestamps(header, frames, "force_timestamp") / 1e6
+    if relative_time:
+        position_timestamps -= position_timestamps[0]
+        force_timestamps -= force_timestamps[0]
+    forces = frames["force"] if force_sign == 1 else frames["force"] * np.float32(force_sign)
+
+    return position_timestamps, frames["position"], force_timestamps, forces
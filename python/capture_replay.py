@@ -0,0 +1,107 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from capture_files import capture_extension, read_capture, timestamp_fields, unwrapped_timestamps
+from frame_schemas import schema_from_columns, schemas
+
+# Plays a recorded CSV or .bin capture back as a frame source with the same read interface as RingReader and
+# TelemetryClient. The unwrapped timestamps are indexed once when the file is opened, so seeking is a binary
+# search rather than a rescan. Frames are returned with their timestamp fields widened to unwrapped int64.
+
+chunk_frames = 1024         # frames returned per read when playing as fast as possible
+poll_interval = 0.001       # s a paced read sleeps when the next frame is not due yet
+
+
+def replay_dtype(dtype: np.dtype) -> np.dtype:
+    return np.dtype([(name, "<i8" if name in timestamp_fields(dtype) else dtype[name].str) for name in dtype.names])
+
+
+class CaptureReplay:
+    def __init__(self, filename: str, speed: float = 1.0, loop: bool = False):
+        # speed is a multiple of real time, 0 plays as fast as the reader asks for frames
+        if filename.endswith(capture_extension):
+            header, recorded = read_capture(filename)
+            self.schema = header["schema"]
+            self.frames = np.empty(len(recorded), dtype=replay_dtype(recorded.dtype))
+            for name in recorded.dtype.names:
+                self.frames[name] = unwrapped_timestamps(header, recorded, name) \
+                    if name in timestamp_fields(recorded.dtype) else recorded[name]
+        else:
+            recorded = pd.read_csv(filename)
+            self.schema = schema_from_columns(recorded.columns).struct
+            self.frames = np.empty(len(recorded), dtype=replay_dtype(schemas[self.schema].dtype))
+            for name in self.frames.dtype.names:
+                self.frames[name] = recorded[name]
+        self.dtype = self.frames.dtype
+        self.speed = speed
+        self.loop = loop
+
+        # seek index: seconds since the first frame
+        timestamps = self.frames[self.dtype.names[0]]
+        self.times = (timestamps - timestamps[0]) / schemas[self.schema].timestamps_per_second if len(timestamps) \
+            else np.zeros(0)
+        self.duration = self.times[-1] if len(self.times) else 0.0
+
+        self.lock = threading.Lock()
+        self.position = 0
+        self.play_start_time = time.monotonic()
+        self.play_start_position = 0
+        self.seeks = 0
+        self.seeks_at_read = 0      # seek count when the frames last returned by read() were taken
+        self.frames_played = 0
+
+    def seek(self, seconds: float):
+        with self.lock:
+            self.position = int(np.searchsorted(self.times, seconds))
+            self.play_start_time = time.monotonic()
+            self.play_start_position = self.position
+            self.seeks += 1
+
+    def set_speed(self, speed: float):
+        with self.lock:
+            self.speed = speed
+            self.play_start_time = time.monotonic()
+            self.play_start_position = self.position
+
+    def current_time(self) -> float:
+        return self.times[min(self.position, len(self.times) - 1)] if len(self.times) else 0.0
+
+    def read(self) -> np.ndarray:
+        # frames due by now, or the next chunk when playing as fast as possible
+        with self.lock:
+            if self.position >= len(self.frames) and self.loop and len(self.frames):
+                self.position = 0
+                self.play_start_time = time.monotonic()
+                self.play_start_position = 0
+                self.seeks += 1
+            start = self.position
+            if start >= len(self.frames):
+                return self.frames[start:]
+            if self.speed > 0:
+                due = self.times[self.play_start_position] + (time.monotonic() - self.play_start_time) * self.speed
+                end = int(np.searchsorted(self.times, due, side="right"))
+            else:
+                end = start + chunk_frames
+            end = max(min(end, len(self.frames)), start)
+            self.position = end
+            self.frames_played += end - start
+            self.seeks_at_read = self.seeks
+            return self.frames[start:end]
+
+    def wait(self, timeout: float = None) -> np.ndarray:
+        # blocks until at least one frame is due (after the end, until a seek) or timeout expires
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frames = self.read()
+            if len(frames) or (deadline is not None and time.monotonic() >= deadline):
+                return frames
+            time.sleep(poll_interval)
+
+    def closed(self) -> bool:
+        return self.position >= len(self.frames) and not self.loop
+
+    def counters(self) -> dict:
+        # same keys as FrameValidator.counters(); a recording has nothing left to lose
+        return {"dropped_frames": 0, "resyncs": 0, "out_of_order": 0, "frames_played": self.frames_played,
+                "seeks": self.seeks}
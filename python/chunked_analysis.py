@@ -0,0 +1,417 @@
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from capture_files import capture_extension, read_capture, timestamp_fields
+from frame_schemas import schema_from_columns
+from timestamps import TimestampUnwrapper
+from velocity_estimators import cycle_peak_distance
+from scipy.signal import find_peaks
+
+# Streaming versions of the core reductions for captures too large to load at once. A capture (CSV log or
+# .bin) is read in fixed-size chunks and every reducer carries its state across chunk boundaries, so peak
+# memory is set by chunk_frames rather than by the file. Each reducer gets (frames, timestamps, offset):
+# the wire frames of one chunk, their unwrapped int64 timestamps by column, and the index of the first frame.
+# Running a reducer over the whole array in one update is the in-memory path, and the results of the two
+# are identical: sums are taken over blocks of block_frames at fixed frame indices and then added in order,
+# and chunk boundaries always fall on block boundaries, so the order of every addition is the same.
+
+block_frames = 4096
+chunk_frames = 64 * block_frames     # ~30 MB peak for the LOG layout
+
+
+def iter_chunks(filename: str, chunk_frames: int = chunk_frames, start: int = 0, stop: int = None):
+    # (frames, timestamps, offset) for consecutive chunks of frames[start:stop] of a capture; offsets count
+    # from start, so chunk boundaries fall on block boundaries of the range
+    if chunk_frames % block_frames:
+        raise ValueError(f"chunk_frames must be a multiple of {block_frames}")
+
+    if filename.endswith(capture_extension):
+        header, frames = read_capture(filename)
+        offsets = header.get("timestamp_offsets", {})
+        unwrappers = {name: TimestampUnwrapper(offsets.get(name, 0)) for name in timestamp_fields(frames.dtype)}
+        # wraps before the range still count, so the timestamps leading up to it are unwrapped and dropped
+        for skipped in range(0, start, chunk_frames):
+            for name, unwrapper in unwrappers.items():
+                unwrapper.unwrap(frames[name][skipped:min(skipped + chunk_frames, start)])
+        stop = len(frames) if stop is None else min(stop, len(frames))
+        for chunk_start in range(start, stop, chunk_frames):
+            chunk = np.array(frames[chunk_start:min(chunk_start + chunk_frames, stop)])
+            yield chunk, {name: unwrapper.unwrap(chunk[name]) for name, unwrapper in unwrappers.items()}, \
+                chunk_start - start
+        return
+
+    # parsed the way capture_loader.parse_csv does, so the values match a full load. CSV timestamps are
+    # written unwrapped, so the range can start anywhere.
+    schema = schema_from_columns(pd.read_csv(filename, nrows=0).columns)
+    timestamp_columns = schema.timestamp_columns()
+    unwrappers = {}
+    offset = 0
+    for logged_data in pd.read_csv(filename, chunksize=chunk_frames, skiprows=range(1, start + 1),
+                                   nrows=None if stop is None else max(stop - start, 0),
+                                   dtype={name: np.int64 if name in timestamp_columns else schema.dtype[name]
+                                          for name in schema.columns}):
+        chunk = np.empty(len(logged_data), dtype=schema.dtype)
+        timestamps = {}
+        for name in schema.columns:
+            values = logged_data[name].to_numpy()
+            if name in timestamp_columns:
+                if name not in unwrappers:
+                    unwrappers[name] = TimestampUnwrapper(int(values[0]) - int(values[0]) % 2 ** 32)
+                values = values % 2 ** 32
+                timestamps[name] = unwrappers[name].unwrap(values)
+            chunk[name] = values
+        yield chunk, timestamps, offset
+        offset += len(chunk)
+
+
+def block_sums(values: np.ndarray, offset: int, start: int, end: int) -> np.ndarray:
+    # float64 sums of values[start:end] split at the absolute block boundaries (offset is values[0]'s index)
+    if end <= start:
+        return np.zeros(0)
+    first_boundary = -(-(offset + start) // block_frames) * block_frames - offset
+    boundaries = np.arange(first_boundary, end, block_frames)
+    bounds = np.r_[start, boundaries[boundaries > start]]
+    return np.add.reduceat(values[start:end], bounds - start, dtype=np.float64)
+
+
+def running_total(total: float, sums: np.ndarray) -> float:
+    # adds sums to total one at a time, in order (cumsum is sequential, unlike sum)
+    return float(np.cumsum(np.r_[total, sums])[-1])
+
+
+class MaxReducer:
+    # largest value of one column (static friction: peak force before the part breaks loose)
+    def __init__(self, column: str = "force"):
+        self.column = column
+        self.maximum = None
+
+    def update(self, frames: np.ndarray, timestamps: dict, offset: int):
+        if len(frames[self.column]):
+            chunk_max = np.max(frames[self.column])
+            self.maximum = chunk_max if self.maximum is None else max(self.maximum, chunk_max)
+
+    def result(self):
+        return self.maximum
+
+
+class WindowedMean:
+    # mean of one column from the first sample with position > lower to (not including) the last sample with
+    # position < upper, the window kinetic friction is averaged over; None leaves that side open
+    def __init__(self, column: str = "force", lower: float = None, upper: float = None,
+                 position_column: str = "position"):
+        self.column = column
+        self.position_column = position_column
+        self.lower = lower
+        self.upper = upper
+        self.start = 0 if lower is None else None       # absolute index the window starts at
+        self.total = 0.0                                # sum from start to the end of the frames seen so far
+        self.end = None                                 # window end and the sum up to it, once an upper sample is seen
+        self.end_total = 0.0
+        self.num_frames = 0
+
+    def update(self, frames: np.ndarray, timestamps: dict, offset: int):
+        positions = frames[self.position_column]
+        self.num_frames = offset + len(positions)
+        if self.start is None:
+            above = np.flatnonzero(positions > self.lower)
+            if not len(above):
+                return
+            self.start = offset + int(above[0])
+        values = frames[self.column]
+        local_start = max(self.start - offset, 0)
+
+        if self.upper is not None:
+            below = np.flatnonzero(positions[local_start:] < self.upper)
+            if len(below):
+                # sum up to the last candidate end in this chunk: the blocks before its block, then its block
+                # up to the end; the same additions a single pass makes for that end
+                local_end = local_start + int(below[-1])
+                block_start = max(local_end - (offset + local_end) % block_frames, local_start)
+                self.end = offset + local_end
+                self.end_total = running_total(self.total, block_sums(values, offset, local_start, block_start))
+                self.end_total = running_total(self.end_total, block_sums(values, offset, block_start, local_end))
+        self.total = running_total(self.total, block_sums(values, offset, local_start, len(values)))
+
+    def result(self) -> float:
+        if self.start is None:
+            return np.nan
+        if self.upper is None:
+            end, total = self.num_frames, self.total
+        elif self.end is None:
+            return np.nan
+        else:
+            end, total = self.end, self.end_total
+        return total / (end - self.start) if end > self.start else np.nan
+
+
+def fit_stats(times: np.ndarray, positions: np.ndarray) -> tuple:
+    # (count, mean time, mean position, time sum of squares, time-position co-moment) of a run of samples
+    if not len(times):
+        return 0, 0.0, 0.0, 0.0, 0.0
+    times = np.asarray(times, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    mean_time, mean_position = times.mean(), positions.mean()
+    centred = times - mean_time
+    return len(times), mean_time, mean_position, np.dot(centred, centred), np.dot(centred, positions - mean_position)
+
+
+def merge_fit_stats(first: tuple, second: tuple) -> tuple:
+    # pairwise update (Chan et al.), so the fit stays well conditioned over long pulls
+    n_1, time_1, position_1, squares_1, moment_1 = first
+    n_2, time_2, position_2, squares_2, moment_2 = second
+    if not n_1 or not n_2:
+        return second if not n_1 else first
+    n = n_1 + n_2
+    time_step, position_step = time_2 - time_1, position_2 - position_1
+    return (n, time_1 + time_step * n_2 / n, position_1 + position_step * n_2 / n,
+            squares_1 + squares_2 + time_step * time_step * n_1 * n_2 / n,
+            moment_1 + moment_2 + time_step * position_step * n_1 * n_2 / n)
+
+
+class WindowedLinearFit:
+    # least-squares slope of position against time (mm/s) over the same window as WindowedMean, from a
+    # constant-size running fit; the slope matches np.polyfit over the window to rounding
+    def __init__(self, lower: float = None, upper: float = None, position_column: str = "position",
+                 time_column: str = "position_timestamp", timestamps_per_second: float = 1e6):
+        self.lower = lower
+        self.upper = upper
+        self.position_column = position_column
+        self.time_column = time_column
+        self.timestamps_per_second = timestamps_per_second
+        self.first_timestamp = None
+        self.started = lower is None
+        self.stats = fit_stats([], [])          # samples from the window start to the end of the frames so far
+        self.end_stats = None                   # samples up to (not including) the last one below upper
+
+    def update(self, frames: np.ndarray, timestamps: dict, offset: int):
+        positions = frames[self.position_column]
+        if not len(positions):
+            return
+        if self.first_timestamp is None:
+            self.first_timestamp = int(timestamps[self.time_column][0])
+        local_start = 0
+        if not self.started:
+            above = np.flatnonzero(positions > self.lower)
+            if not len(above):
+                return
+            self.started = True
+            local_start = int(above[0])
+        times = (timestamps[self.time_column][local_start:] - self.first_timestamp) / self.timestamps_per_second
+        positions = positions[local_start:]
+
+        if self.upper is not None:
+            below = np.flatnonzero(positions < self.upper)
+            if len(below):
+                self.end_stats = merge_fit_stats(self.stats, fit_stats(times[:below[-1]], positions[:below[-1]]))
+        self.stats = merge_fit_stats(self.stats, fit_stats(times, positions))
+
+    def result(self) -> float:
+        stats = self.stats if self.upper is None else self.end_stats
+        if stats is None or stats[0] < 2 or stats[3] == 0:
+            return np.nan
+        return stats[4] / stats[3]
+
+
+class ResetSegmenter:
+    # (start, end) of each experiment in a capture, as velocity_vs_varying_amax_or_amin.segment_experiments:
+    # a new experiment starts wherever the position drops by more than reset_drop between samples
+    def __init__(self, reset_drop: float = 1.0, position_column: str = "position"):
+        self.reset_drop = reset_drop
+        self.position_column = position_column
+        self.last = None
+        self.starts = [0]
+        self.num_frames = 0
+
+    def update(self, frames: np.ndarray, timestamps: dict, offset: int):
+        positions = frames[self.position_column]
+        if not len(positions):
+            return
+        if self.last is not None:
+            positions = np.concatenate((self.last, positions))
+            offset -= 1
+        self.starts.extend((np.flatnonzero(np.diff(positions) < -self.reset_drop) + 1 + offset).tolist())
+        self.last = positions[-1:]
+        self.num_frames = offset + len(positions)
+
+    def result(self) -> np.ndarray:
+        bounds = np.r_[self.starts, self.num_frames]
+        return np.column_stack((bounds[:-1], bounds[1:]))
+
+
+class TimestampSpacing:
+    # exact median spacing of one timestamp column in seconds; spacings are whole ticks, so a count per
+    # distinct spacing is enough
+    def __init__(self, column: str = "position_timestamp", timestamps_per_second: float = 1e6):
+        self.column = column
+        self.timestamps_per_second = timestamps_per_second
+        self.last = None
+        self.counts = {}
+
+    def update(self, frames: np.ndarray, timestamps: dict, offset: int):
+        values = timestamps[self.column]
+        if not len(values):
+            return
+        spacings, counts = np.unique(np.diff(values, prepend=values[:1] if self.last is None else self.last),
+                                     return_counts=True)
+        if self.last is None:
+            counts[spacings == 0] -= 1      # the prepended first sample
+        for spacing, count in zip(spacings.tolist(), counts.tolist()):
+            self.counts[spacing] = self.counts.get(spacing, 0) + count
+        self.last = values[-1:]
+
+    def result(self) -> float:
+        spacings = sorted(spacing for spacing, count in self.counts.items() if count > 0)
+        cumulative = np.cumsum([self.counts[spacing] for spacing in spacings])
+        if not len(spacings):
+            return np.nan
+        n = cumulative[-1]
+        lower = spacings[int(np.searchsorted(cumulative, (n - 1) // 2 + 1))]
+        upper = spacings[int(np.searchsorted(cumulative, n // 2 + 1))]
+        return (lower + upper) / 2 / self.timestamps_per_second
+
+
+def select_by_distance(peaks: np.ndarray, heights: np.ndarray, distance: int) -> np.ndarray:
+    # find_peaks' distance rule applied to peaks collected separately, step for step: peaks are taken highest
+    # first in the order np.argsort leaves their float64 heights (so equal heights come out as they do in
+    # find_peaks) and each drops the neighbours closer than distance that are still kept. A peak with no
+    # neighbour that close changes nothing, so only those with one are visited.
+    if len(peaks) < 2:
+        return peaks
+    order = np.argsort(np.asarray(heights, dtype=np.float64))[::-1]
+    close = np.diff(peaks) < distance
+    crowded = np.r_[close, False] | np.r_[False, close]
+    keep = np.ones(len(peaks), dtype=bool)
+    for i in order[crowded[order]].tolist():
+        if not keep[i]:
+            continue
+        j = i - 1
+        while j >= 0 and peaks[i] - peaks[j] < distance:
+            keep[j] = False
+            j -= 1
+        j = i + 1
+        while j < len(peaks) and peaks[j] - peaks[i] < distance:
+            keep[j] = False
+            j += 1
+    return peaks[keep]
+
+
+class PeakVelocity:
+    # velocities between consecutive waveform peaks, as velocity_estimators.peak_to_peak_velocities gives them
+    # for a fixed minimum peak distance in samples. Times are seconds since the first sample. Local maxima are
+    # found chunk by chunk exactly as find_peaks finds them (only a run of equal samples at the end of a chunk
+    # is carried over), but find_peaks settles equal heights by an argsort over every peak, so the distance
+    # rule waits for result(): the state is one (index, height, timestamp) per local maximum.
+    def __init__(self, distance: int, position_column: str = "position", time_column: str = "position_timestamp",
+                 timestamps_per_second: float = 1e6):
+        self.distance = distance
+        self.position_column = position_column
+        self.time_column = time_column
+        self.tick = 1 / timestamps_per_second
+        self.first_timestamp = None
+        self.positions = np.zeros(0, dtype=np.float32)
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.buffer_start = 0               # frame index of positions[0]
+        self.peaks, self.heights, self.peak_timestamps = [], [], []
+
+    def update(self, frames: np.ndarray, timestamps: dict, offset: int):
+        if not len(frames[self.position_column]):
+            return
+        if self.first_timestamp is None:
+            self.first_timestamp = int(timestamps[self.time_column][0])
+        positions = np.concatenate((self.positions, frames[self.position_column]))
+        all_timestamps = np.concatenate((self.timestamps, timestamps[self.time_column]))
+
+        # every peak found here is new: the buffer starts one sample before the run it was cut at
+        peaks = find_peaks(positions)[0]
+        self.peaks.append(peaks + self.buffer_start)
+        self.heights.append(positions[peaks])
+        self.peak_timestamps.append(all_timestamps[peaks])
+
+        # a run of equal samples at the end may still turn out to be a peak, so keep it and the sample before
+        cut = len(positions) - 1
+        while cut > 0 and positions[cut - 1] == positions[cut]:
+            cut -= 1
+        cut = max(cut - 1, 0)
+        self.positions = positions[cut:]
+        self.timestamps = all_timestamps[cut:]
+        self.buffer_start += cut
+
+    def result(self) -> np.ndarray:
+        if not self.peaks:
+            return np.zeros(0)
+        peaks = np.concatenate(self.peaks)
+        heights = np.concatenate(self.heights)
+        peak_timestamps = np.concatenate(self.peak_timestamps)
+        keep = np.searchsorted(peaks, select_by_distance(peaks, heights, self.distance))
+        peak_times = (peak_timestamps[keep] - self.first_timestamp) * self.tick
+        return np.diff(heights[keep].astype(np.float64)) / np.diff(peak_times)
+
+
+def reduce_capture(filename: str, reducers: list, start: int = 0, stop: int = None,
+                   chunk_frames: int = chunk_frames) -> list:
+    # one pass over frames[start:stop] of a capture
+    for frames, timestamps, offset in iter_chunks(filename, chunk_frames, start, stop):
+        for reducer in reducers:
+            reducer.update(frames, timestamps, offset)
+    return [reducer.result() for reducer in reducers]
+
+
+def reduce_frames(frames, timestamps: dict, reducers: list) -> list:
+    # the in-memory path: every reducer sees the whole capture at once; frames may also be a dict of columns
+    for reducer in reducers:
+        reducer.update(frames, timestamps, 0)
+    return [reducer.result() for reducer in reducers]
+
+
+def max_force(filename: str, chunk_frames: int = chunk_frames) -> float:
+    return reduce_capture(filename, [MaxReducer("force")], chunk_frames=chunk_frames)[0]
+
+
+def windowed_mean_force(filename: str, lower: float = None, upper: float = None,
+                        chunk_frames: int = chunk_frames) -> float:
+    return reduce_capture(filename, [WindowedMean("force", lower, upper)], chunk_frames=chunk_frames)[0]
+
+
+def experiment_segments(filename: str, reset_drop: float = 1.0, chunk_frames: int = chunk_frames) -> np.ndarray:
+    return reduce_capture(filename, [ResetSegmenter(reset_drop)], chunk_frames=chunk_frames)[0]
+
+
+def peak_velocities(filename: str, frequency: float, start: int = 0, stop: int = None,
+                    chunk_frames: int = chunk_frames) -> np.ndarray:
+    # two passes: the median sample spacing sets the peak distance, then the peaks are found
+    spacing = reduce_capture(filename, [TimestampSpacing()], start, stop, chunk_frames)[0]
+    return reduce_capture(filename, [PeakVelocity(cycle_peak_distance(spacing, frequency))], start, stop,
+                          chunk_frames)[0]
+
+
+if __name__ == "__main__":
+    arguments = [argument for argument in sys.argv[1:] if argument != "--check"]
+    if not arguments:
+        print("Usage: python chunked_analysis.py capture.csv|capture.bin [frequency] [--check]")
+        sys.exit(1)
+
+    filename = arguments[0]
+    frequency = float(arguments[1]) if len(arguments) > 1 else 20
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    maximum, mean, segments = reduce_capture(filename, [MaxReducer(), WindowedMean(), ResetSegmenter()])
+    velocities = peak_velocities(filename, frequency)
+    elapsed = time.perf_counter() - start_time
+    print(f"max force {maximum:.4f} N, mean force {mean:.4f} N, {len(segments)} experiments, "
+          f"{len(velocities)} peak-to-peak velocities (mean {np.mean(velocities):.3f} mm/s)")
+    print(f"{elapsed:.2f} s, peak traced memory {tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB")
+
+    if "--check" in sys.argv:
+        # against the in-memory expressions in friction_analysis and velocity_estimators, on the whole capture;
+        # np.mean sums float32 in float32, so the means agree to float32 precision rather than exactly
+        from capture_loader import read_data
+        from velocity_estimators import peak_to_peak_velocities
+        position_timestamps, positions, _, forces = read_data(filename)
+        checks = {"max force": (maximum, np.max(forces)), "mean force": (mean, np.mean(forces)),
+                  "velocity": (np.mean(velocities), np.mean(peak_to_peak_velocities(position_timestamps, positions,
+                                                                                    frequency)))}
+        for name, (chunked, in_memory) in checks.items():
+            status = "ok" if np.isclose(chunked, in_memory, rtol=1e-6, equal_nan=True) else "MISMATCH"
+            print(f"{name:<12}{chunked:>14.6f}{in_memory:>14.6f}  {status}")
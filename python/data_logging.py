@@ -1,50 +1,254 @@
+import queue
 import sys
+import threading
 import time
 from PyQt5.QtCore import QThread
+import numpy as np
 import serial
-import struct
+from capture_files import open_capture_writer
+from frame_schemas import frame_struct, schemas
+from frame_sync import FrameValidator, expected_spacing_us
+from shared_ring import RingReader, ring_name_from_port
+from telemetry import TelemetryClient, address_from_port
+
+status_interval = 0.5       # s between status line updates
+read_timeout = 0.02         # s a serial read may block waiting for data
+read_size = 4096            # bytes requested per blocking read
+block_frames = 4096         # frames per block handed to the writer (64 KiB)
+max_queued_blocks = 1024    # blocks the writer may fall behind by (64 MiB of LOG frames) before blocks are dropped
+flush_interval = 0.5        # s, a partially filled block is handed to the writer at least this often
 
 
 class LogThread(QThread):
+    # Filenames ending in .bin are written as raw binary captures (see capture_files.py), anything else as CSV.
+    # A port of the form ring://name or tcp://host:port follows a stream published by serial_ingest.py instead of
+    # opening a device.
     # def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/static/static_test_8_2_motor_speed_700_mass_1094.csv", baudrate=115200):
-        # def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/kinetic/kinetic_test_8_motor_speed_2000_mass_1094.csv",    baudrate=115200):
-        # def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/object_velocity_varying_amax_normal_force/frequency_20_amin_0.7_amax_5.csv", baudrate=115200):
-        # def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/object_velocity_varying_amin_normal_force/frequency_15_amin_1.0_amax_10.csv", baudrate=115200):
+    # def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/kinetic/kinetic_test_8_motor_speed_2000_mass_1094.csv",    baudrate=115200):
+    # def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/object_velocity_varying_amax_normal_force/frequency_20_amin_0.7_amax_5.csv", baudrate=115200):
+    def __init__(self, port="/dev/cu.usbmodem150120301", log_filename="data/object_velocity_varying_amin_normal_force/frequency_15_amin_1.0_amax_10.csv", baudrate=115200, firmware_build="unknown", schema=frame_struct, clock_anchor_ns=None, show_status=True,
+                 expected_spacing=expected_spacing_us, rotate_bytes=None, rotate_seconds=None, stages=()):
         super().__init__()
-        self.ser = serial.Serial(port, baudrate, timeout=0)
+        self.ring = None
+        self.telemetry = None
+        self.ser = None
+        ring_name = ring_name_from_port(port)
+        telemetry_address = address_from_port(port)
+        if ring_name is not None:
+            self.ring = RingReader(ring_name)
+            schema = self.ring.schema
+        elif telemetry_address is not None:
+            self.telemetry = TelemetryClient(*telemetry_address, read_timeout=read_timeout)
+            schema = self.telemetry.schema
+        else:
+            self.ser = serial.Serial(port, baudrate, timeout=read_timeout)
+        self.port = port
         self.log_filename = log_filename
-        self.num_bytes_to_read = 16
+        self.firmware_build = firmware_build
+        self.schema = schema
+        self.frame_dtype = schemas[schema].dtype
+        self.show_status = show_status
         self.running = True
-        self.buffer = []
-        self.buffer_size = 500
+
+        # long captures are split into part files once either limit is reached (None disables rotation)
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.log_filenames = []
+
+        # online analysis run on every validated chunk in the reader thread (e.g. friction_monitor.FrictionMonitor):
+        # objects with feed(frames) and close()
+        self.stages = list(stages)
+
+        # host monotonic clock shared by every logger in a session; the first and latest
+        # (host ns since anchor, device timestamp) pairs let separate rigs be aligned afterwards
+        self.clock_anchor_ns = time.monotonic_ns() if clock_anchor_ns is None else clock_anchor_ns
+        self.first_clock_sync = None
+        self.last_clock_sync = None
+
+        # checks frame alignment, re-aligns after lost bytes and carries partial frames between reads
+        self.validator = FrameValidator(self.frame_dtype, expected_spacing)
+
+        # double buffering: the reader fills one block while the writer drains the other; when the disk falls
+        # behind, spare blocks are allocated up to max_queued_blocks, so the reader never waits on the writer
+        self.write_queue = queue.Queue()
+        self.free_blocks = queue.SimpleQueue()
+        self.free_blocks.put(np.empty(block_frames, dtype=self.frame_dtype))
+        self.block = np.empty(block_frames, dtype=self.frame_dtype)
+        self.block_count = 0
+        self.last_hand_off_time = time.monotonic()
+
+        # throughput and pipeline counters
+        self.frames_logged = 0
+        self.frames_per_second = 0.0
+        self.decode_time = 0.0
+        self.decode_frames_per_second = 0.0
+        self.cpu_per_frame = 0.0            # reader CPU time per frame (s)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.spare_blocks_allocated = 0     # writer fell behind, an extra block was allocated
+        self.blocks_not_written = 0         # dropped because max_queued_blocks were already waiting
+        self.frames_not_written = 0
 
     def run(self):
         try:
-            with open(self.log_filename, 'w') as logfile:
-                logfile.write("position_timestamp,position,force_timestamp,force\n")
-
-                while self.running:
-                    if self.ser.in_waiting >= self.num_bytes_to_read:
-                        data = self.ser.read(self.num_bytes_to_read)
-                        if len(data) == self.num_bytes_to_read:
-                            position_timestamp, position, force_timestamp, force = struct.unpack('<IfIf', data)
-                            line = f"{position_timestamp},{position},{force_timestamp},{force}\n"
-                            print(line)
-                            self.buffer.append(line)
-
-                            if len(self.buffer) >= self.buffer_size:
-                                logfile.writelines(self.buffer)
-                                logfile.flush()
-                                self.buffer.clear()
-
-                if self.buffer:
-                    logfile.writelines(self.buffer)
-                    logfile.flush()
-
-            self.ser.close()
+            with open_capture_writer(self.log_filename, rotate_bytes=self.rotate_bytes,
+                                     rotate_seconds=self.rotate_seconds, port=self.port,
+                                     firmware_build=self.firmware_build, schema=self.schema,
+                                     clock_anchor_ns=self.clock_anchor_ns) as logfile:
+                self.log_filenames = logfile.filenames
+                writer = threading.Thread(target=self.write_blocks, args=(logfile,), daemon=True)
+                writer.start()
+                try:
+                    self.read_frames()
+                finally:
+                    self.hand_off_block()
+                    self.write_queue.put(None)
+                    writer.join()
+                    logfile.close(**self.clock_metadata(), **self.ingest_counters(),
+                                  frames_not_written=self.frames_not_written)
+
+            for source in (self.ring, self.telemetry, self.ser):
+                if source is not None:
+                    source.close()
         except serial.SerialException as e:
             print(f"Serial error: {e}")
 
+    def read_frames(self):
+        last_status_time = time.monotonic()
+        last_status_frames = 0
+        last_status_cpu = time.thread_time()
+
+        while self.running:
+            frames = self.read_chunk()
+            if len(frames):
+                self.record_clock_sync(time.monotonic_ns(), frames)
+                self.store(frames)
+                self.run_stages(frames)
+            elif (self.ring is not None and self.ring.closed()) or (self.telemetry is not None and self.telemetry.closed):
+                break
+
+            now = time.monotonic()
+            if self.block_count and now - self.last_hand_off_time >= flush_interval:
+                self.hand_off_block()
+
+            if now - last_status_time >= status_interval:
+                cpu = time.thread_time()
+                new_frames = self.frames_logged - last_status_frames
+                self.frames_per_second = new_frames / (now - last_status_time)
+                if new_frames:
+                    self.cpu_per_frame = (cpu - last_status_cpu) / new_frames
+                last_status_time = now
+                last_status_frames = self.frames_logged
+                last_status_cpu = cpu
+                self.queue_depth = self.write_queue.qsize()
+                if self.show_status:
+                    self.print_status()
+
+        if self.ser is not None:
+            frames = self.validator.flush()
+            self.store(frames)
+            self.run_stages(frames)
+        for stage in self.stages:
+            stage.close()
+        if self.show_status:
+            print()
+
+    def read_chunk(self) -> np.ndarray:
+        if self.ring is not None:
+            return self.ring.wait(read_timeout)
+        if self.telemetry is not None:
+            try:
+                return self.telemetry.read()
+            except ConnectionError:
+                return np.zeros(0, dtype=self.frame_dtype)
+        # blocks until read_size bytes arrive or read_timeout expires
+        return self.decode(self.ser.read(max(self.ser.in_waiting, read_size)))
+
+    def ingest_counters(self) -> dict:
+        # frames validated in-process, or by the serial_ingest.py process that publishes the stream
+        if self.ring is not None:
+            return self.ring.counters()
+        if self.telemetry is not None:
+            return self.telemetry.counters()
+        return self.validator.counters()
+
+    def record_clock_sync(self, receive_time_ns: int, frames: np.ndarray):
+        sync = (receive_time_ns - self.clock_anchor_ns, int(frames[self.frame_dtype.names[0]][-1]))
+        if self.first_clock_sync is None:
+            self.first_clock_sync = sync
+        self.last_clock_sync = sync
+
+    def clock_metadata(self) -> dict:
+        return {"clock_anchor_ns": self.clock_anchor_ns,
+                "clock_sync": [self.first_clock_sync, self.last_clock_sync]}
+
+    def store(self, frames: np.ndarray):
+        while len(frames):
+            num_copied = min(len(frames), block_frames - self.block_count)
+            self.block[self.block_count:self.block_count + num_copied] = frames[:num_copied]
+            self.block_count += num_copied
+            self.frames_logged += num_copied
+            frames = frames[num_copied:]
+
+            if self.block_count == block_frames:
+                self.hand_off_block()
+
+    def run_stages(self, frames: np.ndarray):
+        for stage in self.stages:
+            stage.feed(frames)
+
+    def hand_off_block(self):
+        self.last_hand_off_time = time.monotonic()
+        if not self.block_count:
+            return
+
+        if self.write_queue.qsize() >= max_queued_blocks:
+            # the writer is this far behind: lose this block rather than stall the serial drain
+            self.blocks_not_written += 1
+            self.frames_not_written += self.block_count
+            self.block_count = 0
+            return
+        self.write_queue.put_nowait((self.block, self.block_count))
+        self.queue_depth = self.write_queue.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        try:
+            self.block = self.free_blocks.get_nowait()
+        except queue.Empty:
+            self.block = np.empty(block_frames, dtype=self.frame_dtype)
+            self.spare_blocks_allocated += 1
+        self.block_count = 0
+
+    def write_blocks(self, logfile):
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            block, count = item
+            logfile.write(block[:count])
+            logfile.flush()
+            self.free_blocks.put(block)
+
+    def decode(self, data: bytes) -> np.ndarray:
+        # decode and validate every whole frame in one pass
+        start = time.perf_counter()
+        frames = self.validator.feed(data)
+
+        self.decode_time += time.perf_counter() - start
+        if self.decode_time > 0:
+            self.decode_frames_per_second = (self.frames_logged + len(frames)) / self.decode_time
+        return frames
+
+    def print_status(self):
+        counters = self.ingest_counters()
+        sys.stdout.write(f"\r{self.frames_logged} frames | {self.frames_per_second:.0f} frames/s | "
+                         f"decoder capacity {self.decode_frames_per_second:.0f} frames/s | "
+                         f"reader CPU {self.cpu_per_frame * 1e6:.2f} us/frame | "
+                         f"queue depth {self.queue_depth} (max {self.max_queue_depth}) | "
+                         f"dropped {counters['dropped_frames']}, resyncs {counters['resyncs']}, "
+                         f"not written {self.frames_not_written}   ")
+        sys.stdout.flush()
+
     def stop(self):
         self.running = False
 
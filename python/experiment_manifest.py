@@ -0,0 +1,61 @@
+import json
+import os
+
+# Dataset series for the fixed-waveform analyses. Each series is a folder of force_<N>_<trial>.csv captures
+# taken with one waveform (a_min, a_max in g, frequency in Hz) and carries the cutoffs its analysis uses, so
+# analysing another dataset is a new entry in experiments.json rather than another block in a script.
+# Cutoffs are either positions (lower/upper_position_for_mask, mm) or, with "single_cutoff": false, one
+# time window per normal force (lower/upper_time_masks, s).
+
+manifest_filename = "experiments.json"
+series_keys = ("name", "folder", "normal_forces", "frequency", "a_min", "a_max")
+
+
+def load_manifest(filename: str = manifest_filename) -> dict:
+    with open(filename) as f:
+        manifest = json.load(f)
+
+    names = set()
+    for series in manifest["series"]:
+        missing = [key for key in series_keys if key not in series]
+        if missing:
+            raise ValueError(f"Series {series.get('name', '?')} in {filename} is missing {missing}")
+        if series["name"] in names:
+            raise ValueError(f"Series {series['name']} appears twice in {filename}")
+        names.add(series["name"])
+
+        series.setdefault("trials", [1, 2, 3])
+        series.setdefault("single_cutoff", True)
+        if series["single_cutoff"]:
+            if "lower_position_for_mask" not in series or "upper_position_for_mask" not in series:
+                raise ValueError(f"Series {series['name']} needs lower/upper_position_for_mask")
+        elif len(series.get("lower_time_masks", [])) != len(series["normal_forces"]) or \
+                len(series.get("upper_time_masks", [])) != len(series["normal_forces"]):
+            raise ValueError(f"Series {series['name']} needs one lower/upper time mask per normal force")
+    return manifest
+
+
+def get_series(manifest: dict, name: str) -> dict:
+    for series in manifest["series"]:
+        if series["name"] == name:
+            return series
+    raise KeyError(f"Unknown series {name!r}, expected one of {[series['name'] for series in manifest['series']]}")
+
+
+def trial_filename(series: dict, normal_force, trial_num: int) -> str:
+    return os.path.join(series["folder"], "force_" + str(normal_force) + "_" + str(trial_num) + ".csv")
+
+
+def trial_cutoffs(series: dict, force_index: int) -> dict:
+    # keyword arguments for the trial analysis of the normal force at force_index
+    if series["single_cutoff"]:
+        return {"lower_position": series["lower_position_for_mask"],
+                "upper_position": series["upper_position_for_mask"]}
+    return {"lower_time": series["lower_time_masks"][force_index],
+            "upper_time": series["upper_time_masks"][force_index]}
+
+
+def series_trials(series: dict) -> list:
+    # (normal_force, trial_num, filename, cutoffs) for every trial, ordered by normal force then trial
+    return [(normal_force, trial_num, trial_filename(series, normal_force, trial_num), trial_cutoffs(series, i))
+            for i, normal_force in enumerate(series["normal_forces"]) for trial_num in series["trials"]]
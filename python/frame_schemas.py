@@ -0,0 +1,124 @@
+import struct
+import sys
+import time
+import numpy as np
+
+# Registry of the frame layouts the firmware can send. Each schema is keyed by its struct string, which is
+# what capture headers, ring and telemetry handshakes and rigs.json record. Logger, plotter, replay and the
+# loaders all take dtypes, column names, units and timestamp rates from here, so a new firmware layout
+# (e.g. one that adds motor current) is a new entry below rather than edits in each script.
+
+# struct format characters used by the firmware and their little-endian NumPy equivalents
+numpy_codes = {"B": "u1", "b": "i1", "H": "u2", "h": "i2", "I": "u4", "i": "i4", "Q": "u8", "q": "i8",
+               "f": "f4", "d": "f8"}
+
+
+class FrameSchema:
+    def __init__(self, name: str, struct_format: str, fields: list, timestamps_per_second: float,
+                 frame_spacing: float):
+        # fields are (column, unit) in wire order; frame_spacing is the nominal spacing in timestamp ticks
+        codes = struct_format.lstrip("<")
+        if not struct_format.startswith("<") or len(codes) != len(fields):
+            raise ValueError(f"{name}: {struct_format} must be little-endian with one code per field")
+        self.name = name
+        self.struct = struct_format
+        self.columns = [column for column, _ in fields]
+        self.units = dict(fields)
+        self.dtype = np.dtype([(column, "<" + numpy_codes[code]) for column, code in zip(self.columns, codes)])
+        self.timestamps_per_second = timestamps_per_second
+        self.frame_spacing = frame_spacing
+        # the dtype must describe exactly the bytes the firmware packs
+        assert self.dtype.itemsize == struct.calcsize(struct_format)
+
+    @property
+    def frame_size(self) -> int:
+        return self.dtype.itemsize
+
+    @property
+    def sample_rate(self) -> float:
+        return self.timestamps_per_second / self.frame_spacing
+
+    def timestamp_columns(self) -> list:
+        return [name for name in self.columns if self.dtype[name].kind in "iu"]
+
+    def decode(self, data: bytes) -> np.ndarray:
+        # zero-copy view of every whole frame in data; a trailing partial frame is left out
+        return np.frombuffer(data, dtype=self.dtype, count=len(data) // self.dtype.itemsize)
+
+
+# LOG build (src/main.cpp): object position from the encoder and force from the load cell, each with its own
+# micros() timestamp, every 2 ms
+log_schema = FrameSchema("log", "<IfIf", [("position_timestamp", "us"), ("position", "mm"),
+                                           ("force_timestamp", "us"), ("force", "N")],
+                         timestamps_per_second=1e6, frame_spacing=2000)
+# PLOT build (src/Finger.cpp): motor targets and actuals with one millis() timestamp, every 1 ms
+plot_schema = FrameSchema("plot", "<Iffff", [("timestamp", "ms"),
+                                              ("motor_1_target_position", "mm"), ("motor_1_actual_position", "mm"),
+                                              ("motor_2_target_position", "mm"), ("motor_2_actual_position", "mm")],
+                          timestamps_per_second=1e3, frame_spacing=1)
+
+schemas = {schema.struct: schema for schema in (log_schema, plot_schema)}
+
+# shorthands for the two layouts in use
+frame_struct, frame_dtype = log_schema.struct, log_schema.dtype
+plot_frame_struct, plot_frame_dtype = plot_schema.struct, plot_schema.dtype
+
+
+def get_schema(key: str) -> FrameSchema:
+    # by struct string ("<IfIf") or name ("log")
+    if key in schemas:
+        return schemas[key]
+    for schema in schemas.values():
+        if schema.name == key:
+            return schema
+    raise KeyError(f"Unknown frame schema {key!r}, expected one of {list(schemas)}")
+
+
+def schema_from_columns(columns) -> FrameSchema:
+    for schema in schemas.values():
+        if schema.columns == list(columns):
+            return schema
+    raise ValueError(f"Columns {list(columns)} do not match a known frame schema")
+
+
+def benchmark_decode(schema: FrameSchema, num_frames: int = 1000000, repeats: int = 5) -> dict:
+    # decode throughput in frames/s of an in-order stream: frombuffer copied out of the read buffer, plus the
+    # per-column copies the plotter and loaders make, the validated path the logger runs on serial reads, and
+    # struct.iter_unpack for reference
+    from frame_sync import FrameValidator
+
+    rng = np.random.default_rng(0)
+    frames = np.zeros(num_frames, dtype=schema.dtype)
+    for name in schema.columns:
+        frames[name] = np.arange(num_frames) * schema.frame_spacing if name in schema.timestamp_columns() \
+            else rng.standard_normal(num_frames)
+    data = frames.tobytes()
+    reads = [data[start:start + 4096] for start in range(0, len(data), 4096)]
+
+    def validate():
+        validator = FrameValidator(schema.dtype, schema.frame_spacing)
+        for read in reads:
+            validator.feed(read)
+
+    def best_rate(decode) -> float:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decode()
+            times.append(time.perf_counter() - start)
+        return num_frames / min(times)
+
+    return {
+        "frombuffer": best_rate(lambda: schema.decode(data).copy()),
+        "frombuffer + columns": best_rate(lambda: [np.array(schema.decode(data)[name]) for name in schema.columns]),
+        "validated, 4 kB reads": best_rate(validate),
+        "struct.iter_unpack": best_rate(lambda: list(struct.iter_unpack(schema.struct, data))),
+    }
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for schema in schemas.values():
+        print(f"{schema.name} ({schema.struct}, {schema.frame_size} bytes, {schema.sample_rate:.0f} Hz nominal)")
+        for method, rate in benchmark_decode(schema, num_frames).items():
+            print(f"  {method:<22}{rate / 1e6:10.1f} M frames/s {rate * schema.frame_size / 1e6:10.0f} MB/s")
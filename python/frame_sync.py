@@ -0,0 +1,143 @@
+import numpy as np
+from frame_schemas import log_schema
+
+# The firmware writes raw frames with no sync word or checksum, so alignment is checked heuristically:
+# the leading timestamp must advance by a plausible amount from frame to frame, any other timestamp
+# field must sit close to it, and float fields must be finite and physically sensible. When a frame
+# fails, the stream is re-aligned on the byte offset whose next few frames pass all checks.
+
+expected_spacing_us = log_schema.frame_spacing    # nominal frame spacing of the LOG firmware build
+max_gap_us = 100000             # larger jumps need re-checking: a firmware pause or a misalignment
+value_limit = 1e4               # |position| in mm and |force| in N never get near this
+tiny_value = 1e-12              # misaligned timestamp bytes decode to denormal-sized floats
+lock_frames = 4                 # consecutive frames that must pass before an alignment is trusted
+
+
+def signed_delta(later: np.ndarray, earlier) -> np.ndarray:
+    # difference of uint32 micros() values, wrap-aware and signed
+    return ((later.astype(np.int64) - earlier + 2 ** 31) % 2 ** 32) - 2 ** 31
+
+
+class FrameValidator:
+    def __init__(self, dtype: np.dtype, expected_spacing: float = expected_spacing_us, max_gap: float = max_gap_us):
+        self.dtype = dtype
+        self.frame_size = dtype.itemsize
+        self.timestamp_field = dtype.names[0]
+        self.other_timestamp_fields = [name for name in dtype.names[1:] if dtype[name].kind in "iu"]
+        self.float_fields = [name for name in dtype.names if dtype[name].kind == "f"]
+        self.expected_spacing = expected_spacing
+        self.max_gap = max_gap
+
+        self.buffer = b""
+        self.locked = False             # whether position in the buffer sits on a trusted frame boundary
+        self.last_timestamp = None
+
+        self.frames_valid = 0
+        self.dropped_frames = 0
+        self.resyncs = 0
+        self.out_of_order = 0
+        self.pauses = 0
+        self.bytes_skipped = 0
+
+    def counters(self) -> dict:
+        return {"frames_valid": self.frames_valid, "dropped_frames": self.dropped_frames, "resyncs": self.resyncs,
+                "out_of_order": self.out_of_order, "pauses": self.pauses, "bytes_skipped": self.bytes_skipped}
+
+    def values_ok(self, frames: np.ndarray) -> np.ndarray:
+        ok = np.ones(len(frames), dtype=bool)
+        for name in self.float_fields:
+            magnitude = np.abs(frames[name])
+            ok &= np.isfinite(magnitude) & (magnitude <= value_limit) & ((magnitude == 0) | (magnitude >= tiny_value))
+        for name in self.other_timestamp_fields:
+            ok &= np.abs(signed_delta(frames[name], frames[self.timestamp_field])) <= self.max_gap
+        return ok
+
+    def chain_ok(self, frames: np.ndarray) -> np.ndarray:
+        # whether each frame's timestamp advances plausibly from the one before it in the array
+        deltas = signed_delta(frames[self.timestamp_field][1:], frames[self.timestamp_field][:-1])
+        return np.r_[True, (deltas > 0) & (deltas <= self.max_gap)]
+
+    def find_alignment(self, buffer: bytes, position: int):
+        # returns the byte offset from position of the first trusted alignment, or None if more data is needed
+        needed = lock_frames * self.frame_size
+        for offset in range(self.frame_size):
+            if len(buffer) - position - offset < needed:
+                return None
+            frames = np.frombuffer(buffer, dtype=self.dtype, count=lock_frames, offset=position + offset)
+            if self.values_ok(frames).all() and self.chain_ok(frames).all():
+                return offset
+        return self.frame_size
+
+    def feed(self, data: bytes) -> np.ndarray:
+        buffer = self.buffer + data if self.buffer else data
+        position = 0
+        accepted = []
+
+        while len(buffer) - position >= self.frame_size:
+            if not self.locked:
+                offset = self.find_alignment(buffer, position)
+                if offset is None:
+                    break
+                self.bytes_skipped += offset
+                position += offset
+                if offset == self.frame_size:
+                    continue
+                if self.frames_valid:
+                    self.resyncs += 1
+                self.locked = True
+
+            num_frames = (len(buffer) - position) // self.frame_size
+            frames = np.frombuffer(buffer, dtype=self.dtype, count=num_frames, offset=position)
+            timestamps = frames[self.timestamp_field]
+            previous = int(timestamps[0]) - 1 if self.last_timestamp is None else self.last_timestamp
+            deltas = signed_delta(timestamps, np.r_[previous, timestamps[:-1]])
+            ok = self.values_ok(frames) & (deltas > 0) & (deltas <= self.max_gap)
+            bad = np.flatnonzero(~ok)
+            num_good = bad[0] if len(bad) else num_frames
+
+            if num_good:
+                self.accept(frames[:num_good], deltas[:num_good], accepted)
+                position += num_good * self.frame_size
+            if num_good == num_frames:
+                break
+
+            # the frame at position failed: the stream went out of order, paused, or lost alignment.
+            # It is a real discontinuity if its values are plausible and the frames after it stay aligned.
+            alignment = self.find_alignment(buffer, position + self.frame_size)
+            if alignment is None:
+                break
+            frame = frames[num_good:num_good + 1]
+            if alignment == 0 and self.values_ok(frame)[0]:
+                if deltas[num_good] <= 0:
+                    self.out_of_order += 1
+                elif self.last_timestamp is not None:
+                    self.pauses += 1
+                self.accept(frame, None, accepted)
+                position += self.frame_size
+            else:
+                self.locked = False
+
+        self.buffer = buffer[position:]
+        if not accepted:
+            return np.zeros(0, dtype=self.dtype)
+        return accepted[0] if len(accepted) == 1 else np.concatenate(accepted)
+
+    def flush(self) -> np.ndarray:
+        # end of stream: whole frames still waiting for a lock check are kept if their values are plausible
+        num_frames = len(self.buffer) // self.frame_size
+        frames = np.frombuffer(self.buffer, dtype=self.dtype, count=num_frames)
+        frames = frames[self.values_ok(frames)]
+        self.bytes_skipped += len(self.buffer) - len(frames) * self.frame_size
+        self.buffer = b""
+        if len(frames):
+            self.frames_valid += len(frames)
+            self.last_timestamp = int(frames[self.timestamp_field][-1])
+        return frames
+
+    def accept(self, frames: np.ndarray, deltas, accepted: list):
+        if deltas is not None:
+            gaps = deltas[deltas > 1.5 * self.expected_spacing]
+            self.dropped_frames += int(np.sum(np.rint(gaps / self.expected_spacing) - 1))
+        self.last_timestamp = int(frames[self.timestamp_field][-1])
+        self.frames_valid += len(frames)
+        accepted.append(frames)
@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
+from batch_runner import batch_values, run_batch
+from capture_loader import read_data
 
 object_mass = 1.094
 gravity = 9.81
@@ -17,20 +18,42 @@ static_color = colors[-1]
 kinetic_color = colors[0]
 
 
-def static_data_analysis(plot=True):
-    static_friction_coefficients = []
+def static_test_coefficient(filename, plot=False):
+    position_timestamps, part_positions, force_timestamps, forces = read_data(filename)
+
+    if plot:
+        plot_data(position_timestamps, part_positions, force_timestamps, forces, static=True)
+
+    return np.max(forces) / (object_mass * gravity)
+
+
+def kinetic_test_coefficient(filename, plot=False):
+    min_position = 1
+    max_position = 10.644 / 2
 
+    position_timestamps, part_positions, force_timestamps, forces = read_data(filename)
+    min_idx = (np.where(part_positions > min_position)[0][0])
+    max_idx = (np.where(part_positions < max_position)[0][-1])
+    lower_limit = int(min_idx)
+    upper_limit = int(max_idx)
+
+    if plot:
+        plot_data(position_timestamps, part_positions, force_timestamps, forces, lower_limit, upper_limit)
+
+    return np.mean(forces) / (object_mass * gravity)
+
+
+def static_data_analysis(plot=True):
+    filenames = []
     for test_num in test_nums:
         filename = "data/static/static_test_" + str(test_num) + "_motor_speed_700_mass_1094.csv"
         if test_num == 8:
             filename = "data/static/static_test_8_2_motor_speed_700_mass_1094.csv"
+        filenames.append(filename)
 
-        position_timestamps, part_positions, force_timestamps, forces = read_data(filename)
-
-        if plot:
-            plot_data(position_timestamps, part_positions, force_timestamps, forces, static=True)
-
-        static_friction_coefficients.append(np.max(forces) / (object_mass * gravity))
+    # one worker when plotting so the figures open here
+    results = run_batch(static_test_coefficient, filenames, workers=1 if plot else None, plot=plot)
+    static_friction_coefficients = batch_values(results)
 
     print("\nStatic Coefficient of Friction = {:.2f} ± {:.2f}\n".format(
         np.mean(static_friction_coefficients), np.std(static_friction_coefficients)))
@@ -49,28 +72,11 @@ def static_data_analysis(plot=True):
 
 
 def kinetic_data_analysis(plot=True):
+    filenames = ["data/kinetic/kinetic_test_" + str(test_num) + "_motor_speed_2000_mass_1094.csv"
+                 for test_num in test_nums]
 
-    min_position = 1
-    max_position = 10.644 / 2
-
-    kinetic_friction_coefficients = []
-    test_velocities = []
-
-    for test_num in test_nums:
-        filename = "data/kinetic/kinetic_test_" + str(test_num) + "_motor_speed_2000_mass_1094.csv"
-        position_timestamps, part_positions, force_timestamps, forces = read_data(filename)
-        min_idx = (np.where(part_positions > min_position)[0][0])
-        max_idx = (np.where(part_positions < max_position)[0][-1])
-        lower_limit = int(min_idx)
-        upper_limit = int(max_idx)
-
-        _, coeffs = best_line_fit(position_timestamps[lower_limit:upper_limit], part_positions[lower_limit:upper_limit])
-        test_velocities.append(coeffs[0])
-
-        if plot:
-            plot_data(position_timestamps, part_positions, force_timestamps, forces, lower_limit, upper_limit)
-
-        kinetic_friction_coefficients.append(np.mean(forces) / (object_mass * gravity))
+    results = run_batch(kinetic_test_coefficient, filenames, workers=1 if plot else None, plot=plot)
+    kinetic_friction_coefficients = batch_values(results)
 
     print("Kinetic Coefficient of Friction = {:.2f} ± {:.2f}\n".format(
         np.mean(kinetic_friction_coefficients), np.std(kinetic_friction_coefficients)))
@@ -88,18 +94,6 @@ def kinetic_data_analysis(plot=True):
     return kinetic_friction_coefficients
 
 
-def read_data(filename: str):
-    logged_data = pd.read_csv(filename)
-    position_timestamps = logged_data["position_timestamp"].to_numpy() / 1e6
-    position_timestamps -= position_timestamps[0]
-    part_positions = logged_data["position"].to_numpy()
-    force_timestamps = logged_data["force_timestamp"].to_numpy() / 1e6
-    force_timestamps -= force_timestamps[0]
-    forces = logged_data["force"].to_numpy()
-
-    return position_timestamps, part_positions, force_timestamps, forces
-
-
 def best_line_fit(position_timestamps, part_positions):
     coeffs = np.polyfit(position_timestamps, part_positions, 1)
     y_fit = np.polyval(coeffs, position_timestamps)
@@ -0,0 +1,160 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from capture_replay import CaptureReplay
+from chunked_analysis import MaxReducer, WindowedLinearFit, WindowedMean
+from timestamps import TimestampUnwrapper
+
+# Friction coefficients from the live stream, reported as soon as each pull is done instead of after the
+# capture has been written. A new pull starts wherever the sled is put back (the position drops by more than
+# reset_drop between samples) and is done once the position reaches max_position, the end of the kinetic
+# window friction_analysis uses. Per pull, mu_s is the peak force, mu_k the mean force over the window and
+# the velocity a least-squares slope over the same window, all from the chunked_analysis reducers, so the
+# state per pull is a handful of numbers however long the pull runs.
+#
+# A FrictionMonitor is a LogThread stage: LogThread(port, log_filename, stages=[FrictionMonitor(mass)])
+# feeds it every validated chunk as it arrives.
+
+default_min_position = 1            # mm, kinetic window as in friction_analysis.kinetic_test_coefficient
+default_max_position = 10.644 / 2
+default_reset_drop = 1.0            # mm
+default_gravity = 9.81
+
+
+class FrictionMonitor:
+    def __init__(self, mass: float, min_position: float = default_min_position,
+                 max_position: float = default_max_position, reset_drop: float = default_reset_drop,
+                 gravity: float = default_gravity, force_sign: float = 1.0, on_pull=None):
+        # on_pull(result) is called with each finished pull; by default a line is printed
+        self.normal_force = mass * gravity
+        self.min_position = min_position
+        self.max_position = max_position
+        self.reset_drop = reset_drop
+        self.force_sign = force_sign
+        self.on_pull = print_pull if on_pull is None else on_pull
+        self.unwrappers = {}
+        self.last_position = None
+        self.pulls = []
+        self.start_pull()
+
+    def start_pull(self):
+        self.max_force = MaxReducer("force")
+        self.mean_force = WindowedMean("force", self.min_position, self.max_position)
+        self.velocity = WindowedLinearFit(self.min_position, self.max_position)
+        self.pull_frames = 0
+        self.pull_start_time = time.monotonic()
+        self.finished = False
+
+    def feed(self, frames: np.ndarray):
+        positions = frames["position"]
+        if not len(positions):
+            return
+        if self.force_sign != 1:
+            frames = frames.copy()
+            frames["force"] *= self.force_sign
+        timestamps = {}
+        for name in (name for name in frames.dtype.names if frames.dtype[name].kind in "iu"):
+            timestamps[name] = self.unwrappers.setdefault(name, TimestampUnwrapper()).unwrap(frames[name])
+
+        # split the chunk where the sled was put back
+        if self.last_position is None:
+            resets = np.flatnonzero(np.diff(positions) < -self.reset_drop) + 1
+        else:
+            resets = np.flatnonzero(np.diff(np.concatenate((self.last_position, positions))) < -self.reset_drop)
+        self.last_position = positions[-1:]
+
+        bounds = np.r_[0, resets, len(positions)]
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if i:
+                self.finish_pull(complete=False)
+                self.start_pull()
+            if end > start:
+                self.feed_pull(frames[start:end], {name: values[start:end] for name, values in timestamps.items()})
+
+    def feed_pull(self, frames: np.ndarray, timestamps: dict):
+        if self.finished:
+            self.pull_frames += len(frames)
+            return
+        # the pull is done at the first sample at the end of the window; samples up to it are still counted
+        reached = np.flatnonzero(frames["position"] >= self.max_position)
+        end = int(reached[0]) if len(reached) else len(frames)
+        for reducer in (self.max_force, self.mean_force, self.velocity):
+            reducer.update(frames[:end], {name: values[:end] for name, values in timestamps.items()},
+                           self.pull_frames)
+        self.pull_frames += len(frames)
+        if len(reached):
+            self.finish_pull(complete=True)
+
+    def finish_pull(self, complete: bool):
+        # a pull the sled never finished (put back early, or the stream ended) is reported once, as incomplete
+        if self.finished or not self.pull_frames:
+            return
+        self.finished = True
+        max_force = self.max_force.result()
+        result = {"pull": len(self.pulls) + 1, "complete": complete, "frames": self.pull_frames,
+                  "mu_s": np.nan if max_force is None else float(max_force) / self.normal_force,
+                  "mu_k": self.mean_force.result() / self.normal_force,
+                  "velocity": self.velocity.result(),
+                  "elapsed": time.monotonic() - self.pull_start_time}
+        self.pulls.append(result)
+        self.on_pull(result)
+
+    def close(self):
+        self.finish_pull(complete=False)
+
+
+def print_pull(result: dict):
+    status = "" if result["complete"] else " (incomplete)"
+    print(f"\npull {result['pull']}{status}: mu_s = {result['mu_s']:.3f}, mu_k = {result['mu_k']:.3f}, "
+          f"velocity = {result['velocity']:.2f} mm/s ({result['frames']} frames)")
+
+
+def print_summary(pulls: list):
+    complete = [pull for pull in pulls if pull["complete"]]
+    if not complete:
+        return
+    for name in ("mu_s", "mu_k", "velocity"):
+        values = [pull[name] for pull in complete]
+        print(f"{name}: {np.nanmean(values):.3f} ± {np.nanstd(values):.3f} over {len(values)} pulls")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report friction coefficients for every pull as it finishes")
+    parser.add_argument("source", help="serial port, ring://name or tcp://host:port to log from, "
+                                       "or a recorded capture (.csv or .bin) to run through the monitor")
+    parser.add_argument("log_filename", nargs="?", help="capture to write when logging a live source")
+    parser.add_argument("--mass", type=float, default=1.094, help="sled mass in kg")
+    parser.add_argument("--min-position", type=float, default=default_min_position)
+    parser.add_argument("--max-position", type=float, default=default_max_position)
+    parser.add_argument("--reset-drop", type=float, default=default_reset_drop)
+    parser.add_argument("--force-sign", type=float, default=1.0, help="-1 for rigs that log pulling force as negative")
+    args = parser.parse_args()
+
+    monitor = FrictionMonitor(args.mass, args.min_position, args.max_position, args.reset_drop,
+                              force_sign=args.force_sign)
+
+    if os.path.exists(args.source):
+        replay = CaptureReplay(args.source, speed=0)
+        while not replay.closed():
+            monitor.feed(replay.read())
+        monitor.close()
+        print_summary(monitor.pulls)
+        sys.exit(0)
+
+    from data_logging import LogThread
+
+    if args.log_filename is None:
+        parser.error("a log filename is needed when logging a live source")
+    log_thread = LogThread(port=args.source, log_filename=args.log_filename, stages=[monitor], show_status=False)
+    log_thread.start()
+    print(f"Logging {args.source} to {args.log_filename}. Press Ctrl+C to stop.")
+    try:
+        while log_thread.isRunning():
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("\nStopping logging...")
+        log_thread.stop()
+        log_thread.wait()
+    print_summary(monitor.pulls)
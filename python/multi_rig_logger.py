@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import time
+from data_logging import LogThread
+from capture_files import capture_extension
+from frame_schemas import frame_struct
+
+# One LogThread per rig. Each reader blocks in serial.read (which releases the GIL) and decodes
+# whole chunks with numpy, so a thread per port keeps up without starving the others.
+
+config_filename = "rigs.json"
+status_interval = 1.0       # s between combined status line updates
+
+
+def load_config(filename: str) -> dict:
+    with open(filename) as f:
+        config = json.load(f)
+
+    for rig in config["rigs"]:
+        if "name" not in rig or "port" not in rig:
+            raise ValueError(f"Every rig in {filename} needs a name and a port: {rig}")
+    return config
+
+
+def start_loggers(config: dict, session_dir: str, clock_anchor_ns: int) -> dict:
+    rotate_bytes = int(config["rotate_megabytes"] * 1e6) if "rotate_megabytes" in config else None
+    rotate_seconds = config["rotate_minutes"] * 60 if "rotate_minutes" in config else None
+
+    loggers = {}
+    for rig in config["rigs"]:
+        log_filename = os.path.join(session_dir, rig.get("log_filename", rig["name"] + capture_extension))
+        loggers[rig["name"]] = LogThread(port=rig["port"], log_filename=log_filename,
+                                         baudrate=rig.get("baudrate", config.get("baudrate", 115200)),
+                                         firmware_build=rig.get("firmware_build", "unknown"),
+                                         schema=rig.get("schema", frame_struct),
+                                         clock_anchor_ns=clock_anchor_ns, show_status=False,
+                                         rotate_bytes=rotate_bytes, rotate_seconds=rotate_seconds)
+
+    for logger in loggers.values():
+        logger.start()
+    return loggers
+
+
+def write_session(session_dir: str, clock_anchor_ns: int, start_time: float, loggers: dict):
+    # the session file ties every rig's output to the shared anchor, including CSV outputs that have no header
+    session = {
+        "clock_anchor_ns": clock_anchor_ns,
+        "start_time_unix": start_time,
+        "rigs": {name: {"port": logger.port,
+                        "log_filenames": [os.path.basename(filename) for filename in logger.log_filenames],
+                        "schema": logger.schema,
+                        "frames_logged": logger.frames_logged,
+                        "frames_not_written": logger.frames_not_written,
+                        **logger.clock_metadata(),
+                        **logger.ingest_counters()}
+                 for name, logger in loggers.items()},
+    }
+    with open(os.path.join(session_dir, "session.json"), "w") as f:
+        json.dump(session, f, indent=4)
+
+
+def print_status(loggers: dict):
+    status = " | ".join(f"{name}: {logger.frames_per_second:.0f} frames/s, queue {logger.queue_depth}, "
+                        f"dropped {logger.ingest_counters()['dropped_frames']}"
+                        for name, logger in loggers.items())
+    sys.stdout.write("\r" + status + "   ")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else config_filename)
+
+    start_time = time.time()
+    clock_anchor_ns = time.monotonic_ns()
+    session_dir = os.path.join(config.get("output_dir", "data"), time.strftime("session_%Y%m%d_%H%M%S"))
+    os.makedirs(session_dir, exist_ok=True)
+
+    loggers = start_loggers(config, session_dir, clock_anchor_ns)
+    print(f"Logging {len(loggers)} rigs to {session_dir}. Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            time.sleep(status_interval)
+            print_status(loggers)
+    except KeyboardInterrupt:
+        print("\nStopping logging...")
+        for logger in loggers.values():
+            logger.stop()
+        for logger in loggers.values():
+            logger.wait()
+        write_session(session_dir, clock_anchor_ns, start_time, loggers)
+        sys.exit(0)
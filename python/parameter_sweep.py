@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from quaid_model import default_gravity, kinetic_acceleration, max_stick_acceleration, velocity_grid
+
+# Parameter sweeps of the quaid model too large to hold in memory. A sweep lives in a directory: sweep.json
+# holds the axes (name -> values, in grid order) and settings, velocity.npy and amplitude.npy hold the
+# results in grid order as memory-mapped .npy files, and done.npy flags every finished chunk. The grid is
+# cut into chunks of whole rows of the trailing axes, and each chunk is evaluated by a worker that writes
+# its block straight into the arrays. Rerunning a sweep only evaluates the chunks not flagged yet, so an interrupted
+# sweep picks up where it stopped.
+#
+# The axes are any of sweep_axes; a fixed value is a one-point axis. Without an a_min axis each force uses
+# its best a_min (quaid_model.max_stick_acceleration). Both outputs are nan where the part would not stick
+# during a_min or not slip during a_max, and with a max_amplitude axis velocity is also nan wherever the
+# amplitude reaches the limit.
+
+sweep_axes = ("frequency", "a_min", "a_max", "force", "mu_s", "mu_k", "max_amplitude")
+required_axes = ("frequency", "a_max", "force", "mu_s", "mu_k")
+outputs = ("velocity", "amplitude")
+default_chunk_points = 2 ** 20
+
+
+def sweep_filename(directory: str, name: str) -> str:
+    return os.path.join(directory, name + (".json" if name == "sweep" else ".npy"))
+
+
+def grid_layout(shape: tuple, chunk_points: int) -> dict:
+    # the trailing axes that fit in chunk_points form one row, and a chunk is a run of consecutive rows; a
+    # last axis longer than chunk_points is still a single row
+    split = len(shape) - 1
+    while split > 0 and int(np.prod(shape[split - 1:])) <= chunk_points:
+        split -= 1
+    rows, row_points = int(np.prod(shape[:split])), int(np.prod(shape[split:]))
+    rows_per_chunk = max(1, chunk_points // row_points)
+    return {"split": split, "rows": rows, "row_points": row_points, "rows_per_chunk": rows_per_chunk,
+            "num_chunks": -(-rows // rows_per_chunk)}
+
+
+def create_sweep(directory: str, axes: dict, m: float, g: float = default_gravity,
+                 chunk_points: int = default_chunk_points, dtype: str = "float32") -> dict:
+    # lays out a new sweep, or returns the settings of the one already in directory if it is the same sweep
+    unknown = set(axes) - set(sweep_axes)
+    missing = set(required_axes) - set(axes)
+    if unknown or missing:
+        raise ValueError(f"unknown axes {sorted(unknown)}, missing axes {sorted(missing)}")
+    names = [name for name in sweep_axes if name in axes]
+    sweep = {"axes": {name: np.atleast_1d(np.asarray(axes[name], dtype=float)).tolist() for name in names},
+             "m": m, "g": g, "chunk_points": chunk_points, "dtype": dtype}
+    sweep["shape"] = [len(sweep["axes"][name]) for name in names]
+    sweep.update(grid_layout(sweep["shape"], chunk_points))
+
+    if os.path.exists(sweep_filename(directory, "sweep")):
+        with open(sweep_filename(directory, "sweep")) as f:
+            existing = json.load(f)
+        if existing != sweep:
+            raise ValueError(f"{directory} holds a different sweep; remove it or use another directory")
+        return existing
+
+    os.makedirs(directory, exist_ok=True)
+    for name in outputs:
+        np.lib.format.open_memmap(sweep_filename(directory, name), mode="w+", dtype=dtype,
+                                  shape=tuple(sweep["shape"])).flush()
+    np.lib.format.open_memmap(sweep_filename(directory, "done"), mode="w+", dtype=np.uint8,
+                              shape=(sweep["num_chunks"],)).flush()
+    # sweep.json goes last: a directory without it is laid out again from scratch
+    temporary_filename = sweep_filename(directory, "sweep") + ".tmp"
+    with open(temporary_filename, "w") as f:
+        json.dump(sweep, f, indent=1)
+    os.replace(temporary_filename, sweep_filename(directory, "sweep"))
+    return sweep
+
+
+def chunk_values(sweep: dict, chunk: int) -> dict:
+    # axis values for one chunk, shaped to broadcast to (rows in the chunk,) + the trailing axes
+    shape, split = sweep["shape"], sweep["split"]
+    first = chunk * sweep["rows_per_chunk"]
+    rows = np.arange(first, min(first + sweep["rows_per_chunk"], sweep["rows"]))
+    row_index = np.unravel_index(rows, shape[:split]) if split else ()
+    values = {}
+    for axis, (name, axis_values) in enumerate(sweep["axes"].items()):
+        axis_values = np.asarray(axis_values)
+        if axis < split:
+            values[name] = axis_values[row_index[axis]].reshape((-1,) + (1,) * (len(shape) - split))
+        else:
+            values[name] = axis_values.reshape([1] + [-1 if i == axis else 1 for i in range(split, len(shape))])
+    return values
+
+
+def evaluate_chunk(directory: str, chunk: int) -> int:
+    with open(sweep_filename(directory, "sweep")) as f:
+        sweep = json.load(f)
+    values = chunk_values(sweep, chunk)
+    velocity, amplitude, allowed = velocity_grid(values["frequency"], values["force"], values["a_max"], sweep["m"],
+                                                 values["mu_s"], values["mu_k"], a_min=values.get("a_min"),
+                                                 g=sweep["g"], max_amplitude=values.get("max_amplitude"))
+
+    # the model only holds where the part sticks during a_min and slips during a_max
+    stick_limit = max_stick_acceleration(values["force"], sweep["m"], values["mu_s"], sweep["g"])
+    a_min = stick_limit if "a_min" not in values else values["a_min"]
+    valid = (a_min > 0) & (a_min <= stick_limit) & (
+        kinetic_acceleration(values["force"], sweep["m"], values["mu_k"], sweep["g"]) < values["a_max"])
+
+    first = chunk * sweep["rows_per_chunk"]
+    last = min(first + sweep["rows_per_chunk"], sweep["rows"])
+    block_shape = [last - first] + sweep["shape"][sweep["split"]:]
+    start, stop = first * sweep["row_points"], last * sweep["row_points"]
+    for name, result in (("velocity", np.where(allowed & valid, velocity, np.nan)),
+                         ("amplitude", np.where(valid, amplitude, np.nan))):
+        array = np.load(sweep_filename(directory, name), mmap_mode="r+")
+        array.reshape(-1)[start:stop] = np.broadcast_to(result, block_shape).reshape(-1)
+        array.flush()
+        del array
+    return chunk
+
+
+def run_sweep(directory: str, axes: dict, m: float, g: float = default_gravity, workers: int = None,
+              chunk_points: int = default_chunk_points, dtype: str = "float32", show_report: bool = True) -> dict:
+    # evaluates every chunk not done yet on a process pool (workers defaults to the number of cores,
+    # workers=1 runs in this process) and returns load_sweep(directory). A chunk that fails stays undone and
+    # is tried again on the next run.
+    start = time.perf_counter()
+    sweep = create_sweep(directory, axes, m, g, chunk_points, dtype)
+    done = np.load(sweep_filename(directory, "done"), mmap_mode="r+")
+    pending = np.flatnonzero(done == 0).tolist()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(pending)))
+
+    errors = []
+    if workers == 1:
+        for chunk in pending:
+            try:
+                done[evaluate_chunk(directory, chunk)] = 1
+            except Exception:
+                errors.append((chunk, traceback.format_exc()))
+            done.flush()
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(evaluate_chunk, directory, chunk): chunk for chunk in pending}
+            for future in as_completed(futures):
+                try:
+                    done[future.result()] = 1
+                except Exception:
+                    errors.append((futures[future], traceback.format_exc()))
+                done.flush()
+
+    if show_report:
+        points = int(np.prod(sweep["shape"]))
+        print(f"sweep {directory}: {len(pending) - len(errors)}/{len(pending)} pending chunks of "
+              f"{sweep['num_chunks']} ({points} points) in {time.perf_counter() - start:.2f} s on {workers} worker(s)")
+        for chunk, error in errors[:1]:
+            print(f"\n{len(errors)} chunk(s) failed, the first was chunk {chunk}:\n{error}")
+    del done
+    return load_sweep(directory)
+
+
+def load_sweep(directory: str, mode: str = "r") -> dict:
+    # {"settings", "axes", "complete", "velocity", "amplitude"}; the results are memory-mapped arrays with
+    # one dimension per axis, in the order of settings["axes"]
+    with open(sweep_filename(directory, "sweep")) as f:
+        settings = json.load(f)
+    sweep = {"settings": settings, "axes": {name: np.asarray(values) for name, values in settings["axes"].items()},
+             "complete": bool(np.load(sweep_filename(directory, "done")).all())}
+    for name in outputs:
+        sweep[name] = np.load(sweep_filename(directory, name), mmap_mode=mode)
+    return sweep
+
+
+def select(sweep: dict, output: str = "velocity", **axis_values) -> tuple:
+    # slice of an output at the grid points nearest the given axis values, e.g. select(sweep, mu_s=0.2,
+    # a_max=98); returns (values, remaining axes) with the named axes dropped
+    index = []
+    remaining = {}
+    for name, values in sweep["axes"].items():
+        if name in axis_values:
+            index.append(int(np.argmin(np.abs(values - axis_values[name]))))
+        else:
+            index.append(slice(None))
+            remaining[name] = values
+    return np.asarray(sweep[output][tuple(index)]), remaining
+
+
+def best_point(sweep: dict, output: str = "velocity", block_points: int = default_chunk_points) -> tuple:
+    # (value, {axis: value}) of the largest finite output, read a block at a time; None if there is none
+    flat = sweep[output].reshape(-1)
+    best, best_index = -np.inf, None
+    for start in range(0, len(flat), block_points):
+        block = np.asarray(flat[start:start + block_points])
+        block = np.where(np.isfinite(block), block, -np.inf)
+        i = int(np.argmax(block))
+        if block[i] > best:
+            best, best_index = float(block[i]), start + i
+    if best_index is None:
+        return None
+    index = np.unravel_index(best_index, sweep[output].shape)
+    return best, {name: float(values[i]) for (name, values), i in zip(sweep["axes"].items(), index)}
+
+
+def parse_axis(text: str) -> np.ndarray:
+    # "2:100:200" is 200 points from 2 to 100, anything else a comma-separated list of values
+    if ":" in text:
+        start, stop, num = text.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(value) for value in text.split(",")])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep the quaid model over a parameter grid into a directory; "
+                                                 "rerun the same command to resume")
+    parser.add_argument("directory")
+    for name in sweep_axes:
+        parser.add_argument("--" + name.replace("_", "-"), type=parse_axis, metavar="VALUES",
+                            help="START:STOP:NUM or a comma-separated list")
+    parser.add_argument("--m", type=float, default=0.358, help="part mass in kg")
+    parser.add_argument("--g", type=float, default=default_gravity)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-points", type=int, default=default_chunk_points)
+    args = parser.parse_args()
+
+    axes = {name: getattr(args, name) for name in sweep_axes if getattr(args, name) is not None}
+    sweep = run_sweep(args.directory, axes, args.m, args.g, args.workers, args.chunk_points)
+    best = best_point(sweep) if sweep["complete"] else None
+    if best is not None:
+        print(f"best {best[0]:.2f} mm/s at " + ", ".join(f"{name} = {value:g}" for name, value in best[1].items()))
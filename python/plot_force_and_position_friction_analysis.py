@@ -1,18 +1,6 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-
-
-def read_data(filename: str):
-    logged_data = pd.read_csv(filename)
-    position_timestamps = logged_data["position_timestamp"].to_numpy() / 1e6
-    position_timestamps -= position_timestamps[0]
-    part_positions = logged_data["position"].to_numpy()
-    force_timestamps = logged_data["force_timestamp"].to_numpy() / 1e6
-    force_timestamps -= force_timestamps[0]
-    forces = logged_data["force"].to_numpy() * -1
-
-    return position_timestamps, part_positions, force_timestamps, forces
+from capture_loader import read_data
 
 
 def best_line_fit(position_timestamps, part_positions):
@@ -53,7 +41,7 @@ def plot_data(position_timestamps, part_positions, force_timestamps, forces):
 
 if __name__ == "__main__":
     filename = "data/optimal_a_min_varying_normal_force/sensor_data_log.csv"
-    position_timestamps, part_positions, force_timestamps, forces = read_data(filename)
+    position_timestamps, part_positions, force_timestamps, forces = read_data(filename, force_sign=-1)
 
     # define cutoffs for data
     lower_index = 0
@@ -0,0 +1,181 @@
+import sys
+import time
+import numpy as np
+
+# Closed-form model of a part carried by the quaid waveform: the surface accelerates at a_s (a_min, the part
+# sticks) for most of each period and decelerates at a_max (the part slips and decelerates at a_k, set by
+# kinetic friction) for the rest. Every function takes its physical parameters explicitly and broadcasts,
+# so a design space is evaluated as one grid, e.g. frequencies[:, None] against forces[None, :], with
+# further axes for a_min and a_max. Accelerations are in m/s^2, forces in N, masses in kg; velocities come
+# back in mm/s and amplitudes in mm, the units the plots and the amplitude limit use.
+
+default_gravity = 9.81
+
+
+def kinetic_acceleration(force, m: float, mu_k: float, g: float = default_gravity):
+    # deceleration of the slipping part under normal force `force`
+    return g + mu_k * np.asarray(force) / m
+
+
+def max_stick_acceleration(force, m: float, mu_s: float, g: float = default_gravity):
+    # largest a_min at which the part still sticks under normal force `force`, the best a_min for that force
+    return mu_s * np.asarray(force) / m - g
+
+
+def min_stick_force(a_min, m: float, mu_s: float, g: float = default_gravity):
+    # smallest normal force at which the part sticks during the a_min phase
+    return m / mu_s * (np.asarray(a_min) + g)
+
+
+def force_range(a_max: float, m: float, mu_s: float, mu_k: float, g: float = default_gravity) -> tuple:
+    # from the force where a_min = 0 still sticks to the force where the part no longer slips at a_max
+    return m * g / mu_s, m * (a_max - g) / mu_k
+
+
+def average_velocity(frequency, a_s, a_k, a_max):
+    # mean part velocity in mm/s
+    period = 1 / np.asarray(frequency)
+    return 1000 * period / 2 * (a_s ** 2 * (a_max - a_k)) / ((a_s + a_max) * (a_s + a_k))
+
+
+def waveform_amplitude(frequency, a_s, a_max):
+    # peak surface displacement in mm, reached half way through the period: integrating the two phases up to
+    # there reduces to (period / 2)^2 / 2 times the series combination of a_s and a_max
+    period = 1 / np.asarray(frequency)
+    return 1000 * period ** 2 / 8 * a_s * a_max / (a_s + a_max)
+
+
+def velocity_grid(frequency, force, a_max, m: float, mu_s: float, mu_k: float, a_min=None,
+                  g: float = default_gravity, max_amplitude: float = None) -> tuple:
+    # (velocity, amplitude, allowed) on the broadcast grid of the inputs. a_min=None uses the best a_min for
+    # each force; with a given a_min the model assumes the part sticks, which holds above min_stick_force.
+    # allowed masks out waveforms whose amplitude is at or above max_amplitude (mm).
+    a_k = kinetic_acceleration(force, m, mu_k, g)
+    a_s = max_stick_acceleration(force, m, mu_s, g) if a_min is None else np.asarray(a_min)
+    velocity = average_velocity(frequency, a_s, a_k, a_max)
+    amplitude = waveform_amplitude(frequency, a_s, a_max)
+    allowed = np.ones(np.shape(amplitude), dtype=bool) if max_amplitude is None else amplitude < max_amplitude
+    return velocity, amplitude, allowed
+
+
+def best_along(velocity, allowed, axis: int = -1) -> tuple:
+    # (best allowed velocity, its index) along axis, e.g. the optimal force for every frequency; nan and -1
+    # where nothing along the axis is allowed
+    masked = np.where(allowed, velocity, -np.inf)
+    index = np.argmax(masked, axis=axis)
+    best = np.take_along_axis(masked, np.expand_dims(index, axis), axis).squeeze(axis)
+    feasible = np.isfinite(best)
+    return np.where(feasible, best, np.nan), np.where(feasible, index, -1)
+
+
+def bisect(function, lower, upper, iterations: int = 64):
+    # root of function on [lower, upper] for every element at once; function(lower) > 0 > function(upper)
+    lower, upper = np.broadcast_arrays(np.asarray(lower, dtype=float), np.asarray(upper, dtype=float))
+    lower, upper = lower.copy(), upper.copy()
+    for _ in range(iterations):
+        middle = (lower + upper) / 2
+        positive = function(middle) > 0
+        lower = np.where(positive, middle, lower)
+        upper = np.where(positive, upper, middle)
+    return (lower + upper) / 2
+
+
+def limit_force(frequency, a_max, max_amplitude, m: float, mu_s: float, g: float = default_gravity):
+    # force (with the best a_min for it) at which the waveform amplitude reaches max_amplitude (mm); inf
+    # where no a_min reaches the limit at that frequency
+    reduced = 8 * max_amplitude / 1000 * np.asarray(frequency) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a_s = np.where(reduced < a_max, reduced * a_max / (a_max - reduced), np.inf)
+    return min_stick_force(a_s, m, mu_s, g)
+
+
+def velocity_slope(force, a_max, m, mu_s, mu_k, g: float = default_gravity, amplitude_exponent: float = 0):
+    # d/dF of log(velocity / amplitude^amplitude_exponent) with the best a_min for each force; frequency
+    # only scales both, so the sign does not depend on it
+    a_s = max_stick_acceleration(force, m, mu_s, g)
+    a_k = kinetic_acceleration(force, m, mu_k, g)
+    d_s, d_k = mu_s / m, mu_k / m
+    slope = 2 * d_s / a_s - d_k / (a_max - a_k) - d_s / (a_s + a_max) - (d_s + d_k) / (a_s + a_k)
+    return slope - amplitude_exponent * (d_s / a_s - d_s / (a_s + a_max))
+
+
+def optimal_force(a_max, m, mu_s, mu_k, g: float = default_gravity):
+    # force with the highest velocity at any fixed frequency when amplitude is not limited; nan where no force
+    # both sticks and slips (a_max too small for the friction)
+    lower, upper = force_range(a_max, m, mu_s, mu_k, g)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        force = bisect(lambda force: velocity_slope(force, a_max, m, mu_s, mu_k, g), lower, upper)
+    return np.where(np.asarray(lower) < upper, force, np.nan)
+
+
+def optimal_design(a_max, m, mu_s, mu_k, max_amplitude, g: float = default_gravity, f_min: float = None,
+                   f_max: float = None) -> dict:
+    # best frequency and force for a surface under an amplitude limit, vectorized over every argument.
+    # Velocity goes as period and amplitude as period^2, so for any force the best frequency is the lowest
+    # one that keeps the amplitude under the limit. Along that boundary velocity goes as
+    # velocity / sqrt(amplitude), whose maximum over force gives the optimum; f_min and f_max clip the
+    # frequency, after which the force is the best one at that frequency.
+    # Returns arrays of frequency, force, a_min, velocity (mm/s), limit_force (at that frequency) and
+    # optimal_force (the unconstrained optimum at any frequency), all nan for surfaces without a force that
+    # both sticks and slips.
+    lower, upper = force_range(a_max, m, mu_s, mu_k, g)
+    # infeasible surfaces are computed along with the rest and masked at the end
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unconstrained = optimal_force(a_max, m, mu_s, mu_k, g)
+        boundary = bisect(lambda force: velocity_slope(force, a_max, m, mu_s, mu_k, g, amplitude_exponent=0.5),
+                          lower, unconstrained)
+        a_s = max_stick_acceleration(boundary, m, mu_s, g)
+        frequency = np.sqrt(1000 * a_s * a_max / (a_s + a_max) / (8 * np.asarray(max_amplitude)))
+        frequency = np.clip(frequency, f_min, f_max) if f_min is not None or f_max is not None else frequency
+        limit = limit_force(frequency, a_max, max_amplitude, m, mu_s, g)
+        force = np.minimum(limit, unconstrained)
+        a_s = max_stick_acceleration(force, m, mu_s, g)
+        velocity = average_velocity(frequency, a_s, kinetic_acceleration(force, m, mu_k, g), a_max)
+    design = {"frequency": frequency, "force": force, "a_min": a_s, "velocity": velocity, "limit_force": limit,
+              "optimal_force": unconstrained}
+    feasible = np.asarray(lower) < upper
+    return {name: np.where(feasible, values, np.nan) for name, values in design.items()}
+
+
+def waveform_kinematics(times, period, a_min, a_max) -> tuple:
+    # (position, velocity, acceleration) of the surface at `times` over repeating periods, in whatever
+    # consistent units the arguments use; a_min for the first t_1 and last t_1 of a period, -a_max between
+    times = np.asarray(times) % period
+    t_1 = a_max / (a_max + a_min) * period / 2
+    t_2 = period - t_1
+    rising, falling = times <= t_1, (times > t_1) & (times <= t_2)
+    position = np.where(rising, 0.5 * a_min * times ** 2,
+                        np.where(falling, a_min * t_1 * (times - 0.5 * t_1) + a_max *
+                                 (t_1 * times - 0.5 * times ** 2 - 0.5 * t_1 ** 2),
+                                 a_min * (0.5 * times ** 2 - period * times + 0.5 * period ** 2)))
+    velocity = np.where(rising, a_min * times,
+                        np.where(falling, a_min * t_1 - a_max * (times - t_1), a_min * (times - period)))
+    acceleration = np.where(falling, -a_max, a_min)
+    return position, velocity, acceleration
+
+
+if __name__ == "__main__":
+    # timing of the optimal-a_min frequency sweep (200 frequencies x 10000 forces) on one grid, and of the
+    # solver over as many surfaces
+    num_forces = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    parameters = {"m": 0.358, "mu_s": 0.22, "mu_k": 0.19}
+    a_max = 20 * default_gravity
+    frequencies = np.logspace(np.log10(2), np.log10(100), num=200)
+    forces = np.linspace(*force_range(a_max, **parameters), num_forces)
+
+    start = time.perf_counter()
+    design = optimal_design(a_max, max_amplitude=3, **parameters)
+    elapsed = time.perf_counter() - start
+    print(f"solver: {design['velocity']:.2f} mm/s at {design['frequency']:.2f} Hz, {design['force']:.2f} N "
+          f"in {elapsed * 1e3:.2f} ms")
+    mu_s = np.random.default_rng(0).uniform(0.15, 0.3, 100000)
+    start = time.perf_counter()
+    optimal_design(a_max, parameters["m"], mu_s, 0.86 * mu_s, max_amplitude=3)
+    print(f"solver: {len(mu_s)} surfaces in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    start = time.perf_counter()
+    velocity, _, allowed = velocity_grid(frequencies[:, None], forces[None, :], a_max, max_amplitude=3, **parameters)
+    best, index = best_along(velocity, allowed)
+    elapsed = time.perf_counter() - start
+    print(f"{velocity.size} evaluations in {elapsed * 1e3:.1f} ms; best {np.nanmax(best):.2f} mm/s at "
+          f"{frequencies[np.nanargmax(best)]:.2f} Hz, {forces[index[np.nanargmax(best)]]:.2f} N")
@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from quaid_model import default_gravity, force_range, limit_force, optimal_design, optimal_force, velocity_grid
 
 """
 What I know:
@@ -21,25 +22,17 @@ What I know:
 """
 
 
-def plot_fixed_waveform_varying_normal_force(a_min: float, a_max: float, frequency: float, max_amplitude: float = 6):
-    forces = np.linspace(F_n_min, F_n_max, 200)
-    T = 1 / frequency
-    average_velocities = []
+def force_grid(a_max: float, parameters: dict, num_forces: int, force_limits: tuple = None) -> np.ndarray:
+    # force_limits defaults to the range where the part both sticks and slips (quaid_model.force_range)
+    return np.linspace(*(force_limits or force_range(a_max, **parameters)), num_forces)
 
-    for force in forces:
-        a_k = g + mu_k * force / m
-        a_s = a_min
-        velocity = 1000 * T / 2 * ((a_s ** 2) * (a_max - a_k)) / ((a_s + a_max) * (a_s + a_k))
 
-        t_1 = a_max / (a_s + a_max) * (T / 2)
-        t_max = t_1 * (a_s / a_max + 1)
-        waveform_amplitude = (a_s * t_1 * (t_max - 0.5 * t_1) + a_max *
-                              (t_1 * t_max - 0.5 * t_max ** 2 - 0.5 * t_1 ** 2)) * 1000
-
-        if waveform_amplitude < max_amplitude:
-            average_velocities.append(velocity)
-        else:
-            average_velocities.append(0.0)
+def plot_fixed_waveform_varying_normal_force(a_min: float, a_max: float, frequency: float, parameters: dict,
+                                             max_amplitude: float = 6, force_limits: tuple = None):
+    forces = force_grid(a_max, parameters, 200, force_limits)
+    velocities, _, allowed = velocity_grid(frequency, forces, a_max, a_min=a_min, max_amplitude=max_amplitude,
+                                           **parameters)
+    average_velocities = np.where(allowed, velocities, 0.0)
 
     plt.plot(forces, average_velocities, 'r', lw=2)
     plt.xlabel("Force (N)")
@@ -49,27 +42,12 @@ def plot_fixed_waveform_varying_normal_force(a_min: float, a_max: float, frequen
     plt.show()
 
 
-def plot_optimal_a_min_varying_normal_force(a_max: float, frequency: float, max_amplitude: float = 6):
-    forces = np.linspace(F_n_min, F_n_max, 100)
-    T = 1 / frequency
-    average_velocities = []
-    force_at_max_amplitude = 0
-    force_at_max_amplitude_set = False
-
-    for force in forces:
-        a_k = mu_k * force / m + g
-        a_s = mu_s * force / m - g
-        velocity = 1000 * T / 2 * ((a_s ** 2) * (a_max - a_k)) / ((a_s + a_max) * (a_s + a_k))
-        average_velocities.append(velocity)
-
-        t_1 = a_max / (a_s + a_max) * (T / 2)
-        t_max = t_1 * (a_s / a_max + 1)
-        waveform_amplitude = (a_s * t_1 * (t_max - 0.5 * t_1) + a_max *
-                              (t_1 * t_max - 0.5 * t_max ** 2 - 0.5 * t_1 ** 2)) * 1000
-
-        if waveform_amplitude > max_amplitude and not force_at_max_amplitude_set:
-            force_at_max_amplitude = force
-            force_at_max_amplitude_set = True
+def plot_optimal_a_min_varying_normal_force(a_max: float, frequency: float, parameters: dict,
+                                            max_amplitude: float = 6, force_limits: tuple = None):
+    forces = force_grid(a_max, parameters, 100, force_limits)
+    average_velocities, waveform_amplitudes, _ = velocity_grid(frequency, forces, a_max, **parameters)
+    over_amplitude = waveform_amplitudes > max_amplitude
+    force_at_max_amplitude = forces[np.argmax(over_amplitude)] if over_amplitude.any() else 0
 
     plt.plot(forces, average_velocities, 'r', lw=2)
     plt.xlabel("Force (N)")
@@ -80,50 +58,17 @@ def plot_optimal_a_min_varying_normal_force(a_max: float, frequency: float, max_
     plt.show()
 
 
-def plot_frequency_dependence_optimal_a_min(f_min: float = 2, f_max: float = 100, max_amplitude: float = 6):
+def plot_frequency_dependence_optimal_a_min(a_max: float, parameters: dict, f_min: float = 2, f_max: float = 100,
+                                            max_amplitude: float = 6):
+    # the best force per frequency is the unconstrained optimum, or the force at the amplitude limit when
+    # that comes first; both are solved for rather than searched on a force grid
     frequencies = np.logspace(np.log10(f_min), np.log10(f_max), num=200)
-    forces = np.linspace(m * g / mu_s, F_n_max, 10000)
-
-    optimal_velocities = []
-
-    for frequency in frequencies:
-        T = 1 / frequency
-        average_velocities = []
-        force_at_max_amplitude = np.inf
-        force_at_max_amplitude_set = False
-        velocity_at_max_force = np.inf
-
-        for force in forces:
-            a_k = mu_k * force / m + g
-            a_s = mu_s * force / m - g
-            velocity = T / 2 * ((a_s ** 2) * (a_max - a_k)) / ((a_s + a_max) * (a_s + a_k))
+    forces = np.minimum(limit_force(frequencies, a_max, max_amplitude, parameters["m"], parameters["mu_s"],
+                                    parameters.get("g", default_gravity)), optimal_force(a_max, **parameters))
+    optimal_velocities, _, _ = velocity_grid(frequencies, forces, a_max, **parameters)
+    design = optimal_design(a_max, max_amplitude=max_amplitude, f_min=f_min, f_max=f_max, **parameters)
 
-            average_velocities.append(velocity)
-
-            t_1 = a_max / (a_s + a_max) * (T / 2)
-            t_max = t_1 * (a_s / a_max + 1)
-            waveform_amplitude = (a_s * t_1 * (t_max - 0.5 * t_1) + a_max *
-                                  (t_1 * t_max - 0.5 * t_max ** 2 - 0.5 * t_1 ** 2)) * 1000
-
-            if waveform_amplitude > max_amplitude and not force_at_max_amplitude_set:
-                force_at_max_amplitude = force
-                force_at_max_amplitude_set = True
-
-                a_k = g + mu_k * force_at_max_amplitude / m
-                a_s = -g + mu_s * force_at_max_amplitude / m
-                velocity_at_max_force = T / 2 * ((a_s ** 2) * (a_max - a_k)) / ((a_s + a_max) * (a_s + a_k))
-
-        # print("Optimal Average Velocity = {:.2f}, Restricted Max Velocity = {:.2f}".format(
-        #     max(average_velocities), velocity_at_max_force))
-
-        unrestricted_max_velocity_force = forces[np.argmax(average_velocities)]
-        if force_at_max_amplitude < unrestricted_max_velocity_force:
-            optimal_velocity = velocity_at_max_force
-        else:
-            optimal_velocity = max(average_velocities)
-        optimal_velocities.append(optimal_velocity * 1000)
-
-    print("Best Frequency: {:.2f} Hz".format(frequencies[np.argmax(optimal_velocities)]))
+    print("Best Frequency: {:.2f} Hz".format(design["frequency"]))
     plt.plot(frequencies, optimal_velocities, 'r', lw=2)
     plt.xlabel("Frequency (Hz)")
     plt.ylabel("Optimal Average Velocity (mm/s)")
@@ -144,11 +89,14 @@ if __name__ == '__main__':
     # F_n_min = m / mu_s * (a_min + g)
     F_n_max = m * (a_max - g) / mu_k
 
+    parameters = {"g": g, "m": m, "mu_s": mu_s, "mu_k": mu_k}
+
     print("Min Force = {:.2f} N, Max Force = {:.2f}".format(F_n_min, F_n_max))
 
-    plot_fixed_waveform_varying_normal_force(a_min, a_max, f, max_amplitude=6)
-    # plot_optimal_a_min_varying_normal_force(a_max=a_max, frequency=f, max_amplitude=6.0)
-    # plot_frequency_dependence_optimal_a_min(max_amplitude=3)
+    plot_fixed_waveform_varying_normal_force(a_min, a_max, f, parameters, max_amplitude=6,
+                                             force_limits=(F_n_min, F_n_max))
+    # plot_optimal_a_min_varying_normal_force(a_max, f, parameters, max_amplitude=6.0)
+    # plot_frequency_dependence_optimal_a_min(a_max, parameters, max_amplitude=3)
 
     """
     Optimal a_min Varying F_n experiment:
@@ -1,12 +1,18 @@
 import pyqtgraph as pg
-from PyQt5.QtWidgets import QApplication, QVBoxLayout, QWidget
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
-from collections import deque
+from PyQt5.QtWidgets import QApplication, QLabel, QSlider, QVBoxLayout, QWidget
+from PyQt5.QtCore import Qt, QThread, QTimer
 import serial.tools.list_ports
 import serial
 import sys
-import struct
+import threading
+import time
 import numpy as np
+from capture_replay import CaptureReplay
+from frame_schemas import frame_struct, plot_frame_dtype, plot_frame_struct, schemas
+from frame_sync import FrameValidator, max_gap_us
+from shared_ring import RingReader
+from telemetry import TelemetryClient
+from timestamps import TimestampUnwrapper
 
 
 def listports():
@@ -19,98 +25,515 @@ def listports():
 
 listports()
 
-# ser = serial.Serial("/dev/cu.usbmodem90392301", 115200, timeout=1)  # Spatula
-ser = serial.Serial("/dev/cu.usbmodem150120301", 115200, timeout=1)  # Transmission
-# ser = serial.Serial("/dev/cu.usbmodem153385601", 115200, timeout=1)  # 2 DoF
-num_bytes_to_read = 20
-teensy_send_data_rate = 1   # ms
+# Set to the ring name given to serial_ingest.py to plot alongside a running logger instead of owning the port
+ring_name = None
+# Or set to (host, port) of a serial_ingest.py telemetry server to plot a rig attached to another machine
+telemetry_address = None
+# Or set to a recorded CSV / .bin capture to replay it through the same plot; replay_speed is a multiple of
+# real time, 0 plays as fast as the plot can take it (a load test). The slider under the plot seeks.
+replay_filename = None
+replay_speed = 1.0
+replay_loop = False
+
+if ring_name is None and telemetry_address is None and replay_filename is None:
+    # ser = serial.Serial("/dev/cu.usbmodem90392301", 115200, timeout=1)  # Spatula
+    ser = serial.Serial("/dev/cu.usbmodem150120301", 115200, timeout=1)  # Transmission
+    # ser = serial.Serial("/dev/cu.usbmodem153385601", 115200, timeout=1)  # 2 DoF
+teensy_send_data_rate = schemas[plot_frame_struct].frame_spacing   # ms (the PLOT build timestamps frames with millis())
 time_window_size = 0.5        # s
 y_axis_max = 2.0
-num_data_points = int(time_window_size / (teensy_send_data_rate / 1000))
 refresh_rate = 1           # ms
+plot_columns = 1000         # windows with more than 2 points per column are drawn min/max decimated
+adaptive_refresh = True     # redraw only when new samples arrived, at most once per display refresh
+show_stats_overlay = True   # render FPS, latency, reader backlog and skipped/coalesced updates on the plot
+stats_log_filename = None   # e.g. "plotter_stats.csv" to append one row of the same numbers per stats_interval
+stats_interval = 1.0        # s
+derived_window_size = 1.0   # s, sliding window of the RMS tracking error and rolling mean force readouts
+quaid_frequency = 15        # Hz, waveform frequency the per-cycle displacement and velocity are measured over
+velocity_cycles = 10        # cycles averaged in the velocity readout
+
+# Lines drawn for each frame schema: PLOT builds send motor targets and actuals, a LOG stream (ring or
+# telemetry source) carries the object position and force
+plot_lines = {
+    plot_frame_struct: [("motor_1_target_position", "Motor 1 Target", 'y', Qt.SolidLine),
+                        ("motor_1_actual_position", "Motor 1 Actual", 'y', Qt.DashLine),
+                        ("motor_2_target_position", "Motor 2 Target", 'g', Qt.SolidLine),
+                        ("motor_2_actual_position", "Motor 2 Actual", 'g', Qt.DashLine)],
+    frame_struct: [("position", "Object Position", 'c', Qt.SolidLine),
+                   ("force", "Force", 'm', Qt.SolidLine)],
+}
+
+
+class PlotBuffer:
+    # Preallocated channel arrays written in whole chunks by the reader thread. Samples are appended until the
+    # arrays are full, then the newest window is moved back to the front, so the latest window is always one
+    # contiguous slice. With room for three windows, a slice handed to the GUI stays intact until roughly
+    # another full window has been appended.
+    def __init__(self, window_points: int, channels: list):
+        self.window_points = window_points
+        self.channels = channels
+        self.capacity = 3 * window_points
+        self.data = np.zeros((len(channels), self.capacity))
+        self.count = 0
+        self.total_appended = 0
+        self.lock = threading.Lock()
+
+    def append(self, columns: np.ndarray):
+        # columns has one row per channel
+        num_samples = columns.shape[1]
+        if num_samples > self.window_points:
+            columns = columns[:, -self.window_points:]
+        with self.lock:
+            if self.count + columns.shape[1] > self.capacity:
+                keep = self.window_points - columns.shape[1]
+                self.data[:, :keep] = self.data[:, self.count - keep:self.count]
+                self.count = keep
+            self.data[:, self.count:self.count + columns.shape[1]] = columns
+            self.count += columns.shape[1]
+            self.total_appended += num_samples
+
+    def window(self) -> np.ndarray:
+        with self.lock:
+            return self.data[:, max(self.count - self.window_points, 0):self.count]
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+
+
+class MinMaxDecimator:
+    # Same interface as PlotBuffer for long windows: samples are folded into fixed-width time buckets (one per
+    # pixel column) keeping each channel's min and max, so a redraw costs 2 points per column regardless of
+    # how many samples the window spans and waveform peaks stay visible. Only the newest bucket is ever
+    # updated; older buckets are final.
+    def __init__(self, window_seconds: float, num_columns: int, channels: list):
+        self.bucket_width = window_seconds / num_columns
+        self.num_buckets = num_columns + 1
+        self.channels = channels
+        self.capacity = 3 * self.num_buckets
+        self.bucket_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.mins = np.zeros((len(channels) - 1, self.capacity))
+        self.maxs = np.zeros((len(channels) - 1, self.capacity))
+        self.count = 0
+        self.total_appended = 0
+        self.lock = threading.Lock()
+
+    def append(self, columns: np.ndarray):
+        # row 0 holds the timestamps, in arrival order
+        ids = np.floor(columns[0] / self.bucket_width).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        group_ids = ids[starts]
+        group_mins = np.minimum.reduceat(columns[1:], starts, axis=1)
+        group_maxs = np.maximum.reduceat(columns[1:], starts, axis=1)
+
+        with self.lock:
+            if self.count and group_ids[0] == self.bucket_ids[self.count - 1]:
+                last = self.count - 1
+                self.mins[:, last] = np.minimum(self.mins[:, last], group_mins[:, 0])
+                self.maxs[:, last] = np.maximum(self.maxs[:, last], group_maxs[:, 0])
+                group_ids, group_mins, group_maxs = group_ids[1:], group_mins[:, 1:], group_maxs[:, 1:]
+
+            num_groups = len(group_ids)
+            if num_groups > self.num_buckets:
+                group_ids = group_ids[-self.num_buckets:]
+                group_mins = group_mins[:, -self.num_buckets:]
+                group_maxs = group_maxs[:, -self.num_buckets:]
+                num_groups = self.num_buckets
+            if self.count + num_groups > self.capacity:
+                keep = self.num_buckets - num_groups
+                for array in (self.bucket_ids, self.mins, self.maxs):
+                    array[..., :keep] = array[..., self.count - keep:self.count]
+                self.count = keep
+            self.bucket_ids[self.count:self.count + num_groups] = group_ids
+            self.mins[:, self.count:self.count + num_groups] = group_mins
+            self.maxs[:, self.count:self.count + num_groups] = group_maxs
+            self.count += num_groups
+            self.total_appended += columns.shape[1]
+
+    def window(self) -> np.ndarray:
+        with self.lock:
+            window = slice(max(self.count - self.num_buckets, 0), self.count)
+            ids, mins, maxs = self.bucket_ids[window], self.mins[:, window], self.maxs[:, window]
+            data = np.empty((len(self.channels), 2 * len(ids)))
+            data[0] = np.repeat(ids * self.bucket_width, 2)
+            data[1:, 0::2] = mins
+            data[1:, 1::2] = maxs
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+
+
+class RollingMean:
+    # Mean of the last `size` samples. A running sum over a circular buffer makes each sample O(1); the sum is
+    # recomputed once per lap of the buffer so float error cannot accumulate.
+    def __init__(self, size: int):
+        self.size = max(int(size), 1)
+        self.values = np.zeros(self.size)
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def append(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)[-self.size:]
+        slots = (self.index + np.arange(len(values))) % self.size
+        self.total += values.sum() - self.values[slots].sum()
+        self.values[slots] = values
+        self.count = min(self.count + len(values), self.size)
+        self.index = (self.index + len(values)) % self.size
+        if self.index < len(values):
+            self.total = self.values.sum()
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else np.nan
+
+
+class CycleVelocity:
+    # Splits the stream into waveform cycles of 1 / frequency measured from the first sample and takes the
+    # position at each cycle boundary, so every sample costs O(1) and each completed cycle gives one
+    # displacement (mm) and velocity (mm/s). Cycles skipped by a pause are averaged over.
+    def __init__(self, frequency: float, num_cycles: int = velocity_cycles):
+        self.period = 1 / frequency
+        self.start_time = None
+        self.cycle = 0
+        self.cycle_start_position = np.nan
+        self.displacement = np.nan
+        self.velocity = np.nan
+        self.velocities = RollingMean(num_cycles)
+
+    def append(self, times: np.ndarray, positions: np.ndarray):
+        if not len(times):
+            return
+        if self.start_time is None:
+            self.start_time = times[0]
+            self.cycle_start_position = positions[0]
+        cycles = np.floor((times - self.start_time) / self.period).astype(np.int64)
+        boundaries = np.flatnonzero(np.diff(cycles, prepend=self.cycle) > 0)
+        if not len(boundaries):
+            return
+        boundary_cycles = np.r_[self.cycle, cycles[boundaries]]
+        boundary_positions = np.r_[self.cycle_start_position, positions[boundaries]]
+        displacements = np.diff(boundary_positions)
+        velocities = displacements / (np.diff(boundary_cycles) * self.period)
+        self.velocities.append(velocities)
+        self.displacement = displacements[-1]
+        self.velocity = velocities[-1]
+        self.cycle = int(boundary_cycles[-1])
+        self.cycle_start_position = boundary_positions[-1]
+
+
+class DerivedChannels:
+    # Streaming quantities the analysis scripts otherwise compute offline, updated by the reader thread for
+    # whichever channels the stream carries: RMS tracking error per motor (PLOT frames), per-cycle object
+    # displacement/velocity and rolling mean force (LOG frames). readout() is safe to call from the GUI.
+    def __init__(self, channels: list, window_points: int, frequency: float = quaid_frequency):
+        self.channels = channels
+        self.window_points = window_points
+        self.frequency = frequency
+        self.reset()
+
+    def reset(self):
+        channels, window_points, frequency = self.channels, self.window_points, self.frequency
+        self.squared_errors = {motor: RollingMean(window_points) for motor in (1, 2)
+                               if f"motor_{motor}_target_position" in channels}
+        self.cycle_velocity = CycleVelocity(frequency) if "position" in channels else None
+        self.force = RollingMean(window_points) if "force" in channels else None
+        self.values = {}
+
+    def append(self, columns: np.ndarray):
+        # same layout as PlotBuffer.append: row 0 is time in s, then one row per channel
+        rows = dict(zip(self.channels, columns[1:]))
+        values = {}
+        for motor, squared_error in self.squared_errors.items():
+            error = rows[f"motor_{motor}_target_position"] - rows[f"motor_{motor}_actual_position"]
+            squared_error.append(error * error)
+            values[f"Motor {motor} RMS error (mm)"] = np.sqrt(squared_error.mean())
+        if self.cycle_velocity is not None:
+            self.cycle_velocity.append(columns[0], rows["position"])
+            values["Cycle displacement (mm)"] = self.cycle_velocity.displacement
+            values["Velocity (mm/s)"] = self.cycle_velocity.velocities.mean()
+        if self.force is not None:
+            # the load cell reads compressive force as negative, flipped as in the analysis scripts
+            self.force.append(-rows["force"])
+            values["Mean force (N)"] = self.force.mean()
+        self.values = values
+
+    def readout(self) -> str:
+        return " | ".join(f"{name}: {value:.3f}" for name, value in self.values.items())
+
+
+class PlotStats:
+    # Measurements shared by the reader thread and the GUI timer. The Teensy and host clocks are unrelated, so
+    # transport latency is measured relative to the smallest (host receive - device timestamp) offset seen,
+    # i.e. the fastest frame is taken as zero transport delay.
+    columns = ["time", "render_fps", "frames_per_second", "latency_mean_ms", "latency_max_ms", "reader_backlog",
+               "refreshes_skipped", "chunks_coalesced", "refreshes_late", "dropped_frames"]
+
+    def __init__(self, log_filename: str = None):
+        self.start_time = time.monotonic()
+        self.min_offset = np.inf
+        self.newest_receive_time = None
+        self.newest_transport_latency = 0.0
+        self.reader_backlog = 0
+        self.frames_received = 0
+        self.chunks_since_draw = 0
+
+        # per interval
+        self.interval_start = self.start_time
+        self.interval_frames = 0
+        self.draws = 0
+        self.latencies = []
+        self.refreshes_skipped = 0
+        self.chunks_coalesced = 0
+        self.refreshes_late = 0
+        self.last_refresh_time = None
+        self.summary = {}
+
+        self.log_file = None
+        if log_filename is not None:
+            self.log_file = open(log_filename, "a")
+            self.log_file.write(",".join(self.columns) + "\n")
+
+    def record_chunk(self, device_time: float, receive_time: float, num_frames: int, backlog: int):
+        # called by the reader with the newest frame's device timestamp (s) and host receive time (s)
+        offset = receive_time - device_time
+        self.min_offset = min(self.min_offset, offset)
+        self.newest_transport_latency = offset - self.min_offset
+        self.newest_receive_time = receive_time
+        self.reader_backlog = backlog
+        self.frames_received += num_frames
+        self.interval_frames += num_frames
+        self.chunks_since_draw += 1
+
+    def reset_clock_offset(self):
+        # the stream jumped (replay seek); the device-to-host offset has to be learnt again
+        self.min_offset = np.inf
+
+    def record_refresh(self, now: float, interval: float, drew: bool):
+        if self.last_refresh_time is not None and now - self.last_refresh_time > 2 * interval:
+            self.refreshes_late += 1
+        self.last_refresh_time = now
+        if not drew:
+            self.refreshes_skipped += 1
+            return
+        self.draws += 1
+        if self.chunks_since_draw:
+            # latency only means something for the draw that first shows the newest sample
+            self.latencies.append(now - self.newest_receive_time + self.newest_transport_latency)
+            self.chunks_coalesced += self.chunks_since_draw - 1
+            self.chunks_since_draw = 0
+
+    def update(self, now: float, dropped_frames: int) -> bool:
+        # closes the interval once stats_interval has passed; returns whether the summary changed
+        elapsed = now - self.interval_start
+        if elapsed < stats_interval:
+            return False
+        latencies = np.asarray(self.latencies) * 1000
+        self.summary = {"time": now - self.start_time, "render_fps": self.draws / elapsed,
+                        "frames_per_second": self.interval_frames / elapsed,
+                        "latency_mean_ms": latencies.mean() if len(latencies) else np.nan,
+                        "latency_max_ms": latencies.max() if len(latencies) else np.nan,
+                        "reader_backlog": self.reader_backlog, "refreshes_skipped": self.refreshes_skipped,
+                        "chunks_coalesced": self.chunks_coalesced, "refreshes_late": self.refreshes_late,
+                        "dropped_frames": dropped_frames}
+        if self.log_file is not None:
+            self.log_file.write(",".join(f"{self.summary[name]:.6g}" for name in self.columns) + "\n")
+            self.log_file.flush()
+
+        self.interval_start = now
+        self.interval_frames = 0
+        self.draws = 0
+        self.latencies = []
+        self.refreshes_skipped = 0
+        self.chunks_coalesced = 0
+        self.refreshes_late = 0
+        return True
+
+    def overlay_text(self) -> str:
+        if not self.summary:
+            return ""
+        return (f"{self.summary['render_fps']:.0f} FPS | {self.summary['frames_per_second']:.0f} frames/s | "
+                f"latency {self.summary['latency_mean_ms']:.1f} ms (max {self.summary['latency_max_ms']:.1f}) | "
+                f"backlog {self.summary['reader_backlog']} frames | skipped {self.summary['refreshes_skipped']}, "
+                f"coalesced {self.summary['chunks_coalesced']}, late {self.summary['refreshes_late']}")
 
 
 class ReadThread(QThread):
-    update_plot_signal = pyqtSignal(float, float, float, float, float)
+    def __init__(self, stats: PlotStats):
+        super().__init__()
+        self.stats = stats
+        # re-aligns on the byte stream if a read ever starts mid-frame and counts lost frames
+        self.validator = FrameValidator(plot_frame_dtype, expected_spacing=teensy_send_data_rate,
+                                        max_gap=max_gap_us / 1000)
+        self.ring_reader = None
+        self.telemetry_client = None
+        self.replay = None
+        self.backlog = 0
+
+        # the source is opened here so its schema is known before the plot is laid out
+        self.schema = plot_frame_struct
+        if ring_name is not None:
+            self.ring_reader = RingReader(ring_name)
+            self.schema = self.ring_reader.schema
+        elif telemetry_address is not None:
+            self.telemetry_client = TelemetryClient(*telemetry_address)
+            self.schema = self.telemetry_client.schema
+        elif replay_filename is not None:
+            self.replay = CaptureReplay(replay_filename, replay_speed, replay_loop)
+            self.schema = self.replay.schema
+            self.seeks_seen = 0
+        self.channels = [name for name, _, _, _ in plot_lines[self.schema]]
+        self.unwrapper = TimestampUnwrapper()
+        # set by RealTimePlot before the thread is started
+        self.plot_buffer = None
+        self.derived_channels = None
 
     def run(self):
+        if self.ring_reader is not None:
+            while True:
+                self.store_frames(self.ring_reader.wait())
+                self.backlog = self.ring_reader.write_seq() - self.ring_reader.cursor
+
+        if self.telemetry_client is not None:
+            while True:
+                self.store_frames(self.telemetry_client.read())
+
+        if self.replay is not None:
+            while True:
+                frames = self.replay.wait()
+                if self.replay.seeks_at_read != self.seeks_seen:
+                    # the window, derived channels and timestamps start over from the new position
+                    self.seeks_seen = self.replay.seeks_at_read
+                    self.plot_buffer.clear()
+                    self.derived_channels.reset()
+                    self.stats.reset_clock_offset()
+                    self.unwrapper = TimestampUnwrapper()
+                self.store_frames(frames)
+
         while True:
-            try:
-                if ser.in_waiting > 0:
-                    data = ser.read(num_bytes_to_read)
-                    if len(data) == num_bytes_to_read:
-                        timestamp, motor_1_target_position, motor_1_actual_position, motor_2_target_position, motor_2_actual_position = struct.unpack(
-                            '<Iffff', data)  # Little-endian (Arduino is little-endian)
-                        timestamp /= 1000
-                        self.update_plot_signal.emit(
-                            timestamp, motor_1_target_position, motor_1_actual_position,
-                            motor_2_target_position, motor_2_actual_position)
-            except ValueError:
-                pass
-            except IndexError:
-                pass
-            except UnboundLocalError:
-                pass
+            data = ser.read(max(ser.in_waiting, 1))
+            self.backlog = ser.in_waiting // plot_frame_dtype.itemsize
+            self.store_frames(self.validator.feed(data))
+
+    def store_frames(self, frames):
+        if not len(frames):
+            return
+        receive_time = time.monotonic()
+        columns = np.empty((len(self.channels) + 1, len(frames)))
+        timestamps = self.unwrapper.unwrap(frames[frames.dtype.names[0]])
+        columns[0] = timestamps / schemas[self.schema].timestamps_per_second     # millis() or micros() -> s
+        for row, name in enumerate(self.channels, 1):
+            columns[row] = frames[name]
+        self.stats.record_chunk(columns[0, -1], receive_time, len(frames), self.backlog)
+        self.plot_buffer.append(columns)
+        self.derived_channels.append(columns)
+
+    def counters(self) -> dict:
+        if self.ring_reader is not None:
+            return self.ring_reader.counters()
+        if self.telemetry_client is not None:
+            return self.telemetry_client.counters()
+        if self.replay is not None:
+            return self.replay.counters()
+        return self.validator.counters()
 
 
 class RealTimePlot(QWidget):
     def __init__(self):
         super().__init__()
 
+        self.stats = PlotStats(stats_log_filename)
+        self.worker_thread = ReadThread(self.stats)
+        schema = self.worker_thread.schema
+
         self.layout = QVBoxLayout()
         self.plot_widget = pg.PlotWidget()
         self.layout.addWidget(self.plot_widget)
+        self.derived_label = QLabel()
+        self.layout.addWidget(self.derived_label)
+        self.replay_slider = None
+        if self.worker_thread.replay is not None:
+            # 0.1 s steps over the whole capture
+            self.replay_slider = QSlider(Qt.Horizontal)
+            self.replay_slider.setRange(0, int(self.worker_thread.replay.duration * 10))
+            self.replay_slider.sliderReleased.connect(self.seek_replay)
+            self.layout.addWidget(self.replay_slider)
         self.setLayout(self.layout)
 
         self.plot_widget.setTitle("Real-time Sensor Data")
-        self.plot_widget.setLabel('left', 'Position (mm)')
         self.plot_widget.setLabel('bottom', 'Time (s)')
-        self.plot_widget.setYRange(-y_axis_max, y_axis_max, padding=0.1)
+        if schema == plot_frame_struct:
+            self.plot_widget.setLabel('left', 'Position (mm)')
+            self.plot_widget.setYRange(-y_axis_max, y_axis_max, padding=0.1)
+        else:
+            self.plot_widget.setLabel('left', 'Position (mm) / Force (N)')
         self.plot_widget.addLegend()
 
         self.time_window = time_window_size  # 2 seconds
 
-        self.timestamps = deque(maxlen=num_data_points)
-        self.motor_1_target_positions = deque(maxlen=num_data_points)
-        self.motor_1_actual_positions = deque(maxlen=num_data_points)
-        self.motor_2_target_positions = deque(maxlen=num_data_points)
-        self.motor_2_actual_positions = deque(maxlen=num_data_points)
-
-        self.line1 = self.plot_widget.plot([], [], pen=pg.mkPen(
-            color='y', width=3, style=Qt.SolidLine), name="Motor 1 Target")
-        self.line2 = self.plot_widget.plot([], [], pen=pg.mkPen(
-            color='y', width=3, style=Qt.DashLine), name="Motor 1 Actual")
-        self.line3 = self.plot_widget.plot([], [], pen=pg.mkPen(
-            color='g', width=3, style=Qt.SolidLine), name="Motor 2 Target")
-        self.line4 = self.plot_widget.plot([], [], pen=pg.mkPen(
-            color='g', width=3, style=Qt.DashLine), name="Motor 2 Actual")
-
-        self.worker_thread = ReadThread()
-        self.worker_thread.update_plot_signal.connect(self.update_plot)
+        channels = ["time"] + self.worker_thread.channels
+        num_data_points = int(time_window_size * schemas[schema].sample_rate)
+        if num_data_points > 2 * plot_columns:
+            self.plot_buffer = MinMaxDecimator(time_window_size, plot_columns, channels)
+        else:
+            self.plot_buffer = PlotBuffer(num_data_points, channels)
+        self.plotted_samples = 0
+        self.derived_channels = DerivedChannels(self.worker_thread.channels,
+                                                int(derived_window_size * schemas[schema].sample_rate))
+
+        self.stats_overlay = None
+        if show_stats_overlay:
+            self.stats_overlay = pg.TextItem(anchor=(0, 0))
+            self.stats_overlay.setParentItem(self.plot_widget.getPlotItem().getViewBox())
+
+        self.lines = [self.plot_widget.plot([], [], pen=pg.mkPen(color=color, width=3, style=style), name=label)
+                      for _, label, color, style in plot_lines[schema]]
+
+        self.worker_thread.plot_buffer = self.plot_buffer
+        self.worker_thread.derived_channels = self.derived_channels
         self.worker_thread.start()
 
-        # Set up a timer to update the plot
+        # Set up a timer to update the plot; in adaptive mode it never runs faster than the display refreshes
+        self.refresh_interval = refresh_rate
+        if adaptive_refresh:
+            display_rate = QApplication.primaryScreen().refreshRate()
+            if display_rate > 0:
+                self.refresh_interval = max(refresh_rate, int(np.ceil(1000 / display_rate)))
         self.refresh_timer = QTimer()
-        self.refresh_timer.setInterval(refresh_rate)  # Update every 10 ms
+        self.refresh_timer.setInterval(self.refresh_interval)  # ms
         self.refresh_timer.timeout.connect(self.refresh_plot)
         self.refresh_timer.start()
 
-    def update_plot(self, timestamp, value1, value2, value3, value4):
-        self.timestamps.append(timestamp)
-        self.motor_1_target_positions.append(value1)
-        self.motor_1_actual_positions.append(value2)
-        self.motor_2_target_positions.append(value3)
-        self.motor_2_actual_positions.append(value4)
-
-        if len(self.timestamps) > 1:
-            start_time = self.timestamps[0]
-            self.plot_widget.setXRange(start_time, start_time + self.time_window, padding=0)
+    def seek_replay(self):
+        self.worker_thread.replay.seek(self.replay_slider.value() / 10)
 
     def refresh_plot(self):
-        self.line1.setData(self.timestamps, self.motor_1_target_positions)
-        self.line2.setData(self.timestamps, self.motor_1_actual_positions)
-        self.line3.setData(self.timestamps, self.motor_2_target_positions)
-        self.line4.setData(self.timestamps, self.motor_2_actual_positions)
+        now = time.monotonic()
+        if self.replay_slider is not None and not self.replay_slider.isSliderDown():
+            self.replay_slider.setValue(int(self.worker_thread.replay.current_time() * 10))
+        counters = self.worker_thread.counters()
+        if counters["dropped_frames"] or counters["resyncs"] or counters["out_of_order"]:
+            self.plot_widget.setTitle(f"Real-time Sensor Data (dropped {counters['dropped_frames']}, "
+                                      f"resyncs {counters['resyncs']}, out of order {counters['out_of_order']})")
+        if self.stats.update(now, counters["dropped_frames"]) and self.stats_overlay is not None:
+            self.stats_overlay.setText(self.stats.overlay_text())
+
+        # nothing new since the last refresh
+        if adaptive_refresh and self.plot_buffer.total_appended == self.plotted_samples:
+            self.stats.record_refresh(now, self.refresh_interval / 1000, drew=False)
+            return
+        self.plotted_samples = self.plot_buffer.total_appended
+        self.stats.record_refresh(now, self.refresh_interval / 1000, drew=True)
+
+        timestamps, *values = self.plot_buffer.window()
+        for line, channel_values in zip(self.lines, values):
+            line.setData(timestamps, channel_values)
+        self.derived_label.setText(self.derived_channels.readout())
+
+        if len(timestamps) > 1:
+            start_time = timestamps[0]
+            self.plot_widget.setXRange(start_time, start_time + self.time_window, padding=0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+from batch_runner import run_batch
+from capture_loader import file_digest
+
+# Analysis results keyed on (raw file hash, parameter hash), kept in one JSON file. A result is reused for as
+# long as neither the capture's contents nor the parameters it was computed with change, so after adding a
+# trial or editing one series' cutoffs only those trials are analysed again. The parameter hash covers the
+# analysis function's name and a version number the caller bumps when the analysis itself changes.
+# File hashes are remembered by size and mtime, the same check capture_loader uses for its sidecars.
+
+store_version = 1
+
+
+def parameter_hash(function, parameters: dict, version: int = 1) -> str:
+    key = {"function": function.__module__ + "." + function.__qualname__, "version": version,
+           "parameters": parameters}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.digests = {}
+        self.results = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                stored = json.load(f)
+            if stored.get("version") == store_version:
+                self.digests = stored["digests"]
+                self.results = stored["results"]
+
+    def digest(self, filename: str) -> str:
+        stat = os.stat(filename)
+        path = os.path.abspath(filename)
+        known = self.digests.get(path)
+        if known is None or known["size"] != stat.st_size or known["mtime_ns"] != stat.st_mtime_ns:
+            known = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_digest(filename)}
+            self.digests[path] = known
+        return known["sha1"]
+
+    def key(self, filename: str, function, parameters: dict, version: int = 1) -> str:
+        return self.digest(filename) + ":" + parameter_hash(function, parameters, version)
+
+    def get(self, key: str):
+        entry = self.results.get(key)
+        return None if entry is None else entry["value"]
+
+    def put(self, key: str, value, filename: str):
+        # the filename is only there to make the store readable; lookups go by content
+        self.results[key] = {"value": value, "filename": filename}
+
+    def save(self):
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_filename = self.filename + ".tmp"
+        with open(temporary_filename, "w") as f:
+            json.dump({"version": store_version, "digests": self.digests, "results": self.results}, f, indent=1)
+        os.replace(temporary_filename, self.filename)
+
+
+def cached_batch(store: ResultStore, function, filenames: list, file_kwargs: list = None, version: int = 1,
+                 missing=float("nan"), **kwargs) -> list:
+    # values of function over filenames like run_batch + batch_values, running only the files whose
+    # (contents, parameters) have no stored result; results must be JSON-serialisable
+    if file_kwargs is None:
+        file_kwargs = [{}] * len(filenames)
+    call_kwargs = [{**kwargs, **extra} for extra in file_kwargs]
+
+    values = [missing] * len(filenames)
+    keys = [None] * len(filenames)
+    stale = []
+    for i, (filename, parameters) in enumerate(zip(filenames, call_kwargs)):
+        try:
+            keys[i] = store.key(filename, function, parameters, version)
+        except OSError:
+            # unreadable file: let the batch report it
+            stale.append(i)
+            continue
+        value = store.get(keys[i])
+        if value is None:
+            stale.append(i)
+        else:
+            values[i] = value
+
+    print(f"{function.__name__}: {len(filenames) - len(stale)}/{len(filenames)} results reused from {store.filename}")
+    if stale:
+        results = run_batch(function, [filenames[i] for i in stale], file_kwargs=[call_kwargs[i] for i in stale])
+        for i, result in zip(stale, results):
+            if result.ok:
+                values[i] = result.value
+                if keys[i] is not None:
+                    store.put(keys[i], result.value, filenames[i])
+        store.save()
+    return values
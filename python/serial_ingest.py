@@ -0,0 +1,92 @@
+import argparse
+import sys
+import time
+import serial
+from frame_schemas import frame_struct, schemas
+from frame_sync import FrameValidator, expected_spacing_us
+from shared_ring import SharedFrameRing, default_capacity, ring_url_prefix
+from telemetry import TelemetryServer
+
+# Owns one serial port and publishes validated frames into a shared-memory ring, so the logger, the live
+# plot and analysis consumers can all follow the same stream (e.g. LogThread(port="ring://transmission")).
+# Optionally the same frames are fanned out over a socket for tools on other hosts (port="tcp://host:5760").
+
+status_interval = 1.0       # s between status line updates
+read_timeout = 0.02         # s a serial read may block waiting for data
+read_size = 4096            # bytes requested per blocking read
+
+
+class SerialIngest:
+    def __init__(self, port: str, ring_name: str, schema: str = frame_struct, baudrate: int = 115200,
+                 capacity: int = default_capacity, expected_spacing: float = expected_spacing_us,
+                 telemetry_host: str = "127.0.0.1", telemetry_port: int = None, udp: bool = False):
+        self.ser = serial.Serial(port, baudrate, timeout=read_timeout)
+        self.validator = FrameValidator(schemas[schema].dtype, expected_spacing)
+        self.ring = SharedFrameRing(ring_name, schema, capacity)
+        self.telemetry = None
+        if telemetry_port is not None:
+            self.telemetry = TelemetryServer(telemetry_host, telemetry_port, schema, udp)
+        self.running = True
+
+    def run(self):
+        last_status_time = time.monotonic()
+        try:
+            while self.running:
+                data = self.ser.read(max(self.ser.in_waiting, read_size))
+                if data:
+                    frames = self.validator.feed(data)
+                    if len(frames):
+                        self.publish(frames)
+
+                now = time.monotonic()
+                if now - last_status_time >= status_interval:
+                    last_status_time = now
+                    self.ring.update_counters(self.validator.counters())
+                    self.print_status()
+        finally:
+            self.publish(self.validator.flush())
+            self.ring.update_counters(self.validator.counters())
+            self.ring.close()
+            if self.telemetry is not None:
+                self.telemetry.close()
+            self.ser.close()
+
+    def publish(self, frames):
+        self.ring.publish(frames)
+        if self.telemetry is not None:
+            self.telemetry.publish(frames)
+
+    def print_status(self):
+        status = (f"\r{self.ring.write_seq} frames published | "
+                  f"dropped {self.validator.dropped_frames}, resyncs {self.validator.resyncs}")
+        if self.telemetry is not None:
+            for stats in self.telemetry.stats():
+                status += (f" | {stats['address'][0]}:{stats['address'][1]} "
+                           f"{stats['bytes_per_second'] / 1e3:.0f} kB/s, dropped {stats['frames_dropped']}")
+        sys.stdout.write(status + "   ")
+        sys.stdout.flush()
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish one rig's serial stream into a shared-memory ring")
+    parser.add_argument("port")
+    parser.add_argument("ring_name")
+    parser.add_argument("--schema", default=frame_struct, choices=list(schemas))
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--capacity", type=int, default=default_capacity, help="frames held in the ring")
+    parser.add_argument("--expected-spacing", type=float, default=expected_spacing_us, help="frame spacing in us")
+    parser.add_argument("--telemetry-host", default="127.0.0.1", help="interface to serve telemetry on")
+    parser.add_argument("--telemetry-port", type=int, help="also fan frames out on this TCP (or UDP) port")
+    parser.add_argument("--udp", action="store_true", help="serve telemetry over UDP instead of TCP")
+    args = parser.parse_args()
+
+    ingest = SerialIngest(args.port, args.ring_name, args.schema, args.baudrate, args.capacity, args.expected_spacing,
+                          args.telemetry_host, args.telemetry_port, args.udp)
+    print(f"Publishing {args.port} to {ring_url_prefix}{args.ring_name}. Press Ctrl+C to stop.")
+    try:
+        ingest.run()
+    except KeyboardInterrupt:
+        print("\nStopping ingest...")
@@ -0,0 +1,207 @@
+import fcntl
+import os
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from frame_schemas import frame_struct, schemas
+
+# Single-producer, multi-consumer ring of decoded frames in shared memory. Each consumer keeps its own
+# cursor; if the producer laps a cursor, the overwritten frames are reported as an overrun instead of being
+# returned. Publishing is a seqlock: the producer advances reserve_seq to the end of the frames it is about
+# to write, copies them in, then advances write_seq (total frames ever published) to match. Consumers read
+# frames below write_seq and, once they have copied them, treat everything below reserve_seq - capacity as
+# possibly overwritten, including slots a publish is still writing.
+#
+# Python has no atomics or fences, so the ordering between the counters and the frames comes from a lock
+# both sides actually share: an flock() on a file next to the segment (RingLock). The producer stores
+# reserve_seq and write_seq while holding it and consumers load them while holding it, so the kernel orders
+# every frame copied before the producer released the lock ahead of every load after a consumer took it,
+# also on CPUs that reorder memory accesses (ARM). The frames themselves are copied outside the lock.
+
+ring_url_prefix = "ring://"     # LogThread / RealTimePlot port name that attaches to a ring instead of a device
+default_capacity = 2 ** 20      # frames, ~8.7 min at 2 kHz
+poll_interval = 0.005           # s consumers sleep when the ring has nothing new
+
+control_words = ["write_seq", "reserve_seq", "capacity", "itemsize", "closed",
+                 "frames_valid", "dropped_frames", "resyncs", "out_of_order"]
+counter_words = control_words[5:]
+write_index, reserve_index = control_words.index("write_seq"), control_words.index("reserve_seq")
+schema_offset = len(control_words) * 8
+schema_size = 32
+data_offset = 128
+
+# rings created by this process; attaching to one of them must leave the tracker registration alone
+created_rings = set()
+
+
+def ring_name_from_port(port: str):
+    return port[len(ring_url_prefix):] if port.startswith(ring_url_prefix) else None
+
+
+class RingLock:
+    # held by the producer (exclusive) and by consumers (shared) around every access to write_seq and
+    # reserve_seq; each side opens the file itself, so separate objects lock against each other even
+    # within one process
+    def __init__(self, name: str, create: bool = False):
+        self.filename = os.path.join(tempfile.gettempdir(), name.lstrip("/") + ".ringlock")
+        self.fd = os.open(self.filename, os.O_RDWR | (os.O_CREAT if create else 0), 0o600)
+        self.operation = fcntl.LOCK_EX if create else fcntl.LOCK_SH
+
+    def __enter__(self):
+        fcntl.flock(self.fd, self.operation)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self, remove: bool = False):
+        os.close(self.fd)
+        if remove:
+            os.unlink(self.filename)
+
+
+class SharedFrameRing:
+    def __init__(self, name: str, schema: str = frame_struct, capacity: int = default_capacity):
+        self.dtype = schemas[schema].dtype
+        self.capacity = capacity
+        # the lock file exists before the segment, so a consumer that finds the segment can always take it
+        self.lock = RingLock(name, create=True)
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=data_offset + capacity * self.dtype.itemsize)
+        self.control = np.ndarray(len(control_words), dtype=np.int64, buffer=self.shm.buf)
+        self.control[:] = 0
+        self.control[control_words.index("capacity")] = capacity
+        self.control[control_words.index("itemsize")] = self.dtype.itemsize
+        self.shm.buf[schema_offset:schema_offset + schema_size] = schema.encode().ljust(schema_size, b"\0")
+        self.frames = np.ndarray(capacity, dtype=self.dtype, buffer=self.shm.buf, offset=data_offset)
+        self.write_seq = 0
+        created_rings.add(name)
+
+    def publish(self, frames: np.ndarray):
+        if len(frames) > self.capacity:
+            self.write_seq += len(frames) - self.capacity
+            frames = frames[-self.capacity:]
+        end_seq = self.write_seq + len(frames)
+        with self.lock:
+            self.control[reserve_index] = end_seq
+        start = self.write_seq % self.capacity
+        first = min(len(frames), self.capacity - start)
+        self.frames[start:start + first] = frames[:first]
+        self.frames[:len(frames) - first] = frames[first:]
+        self.write_seq = end_seq
+        with self.lock:
+            self.control[write_index] = end_seq
+
+    def update_counters(self, counters: dict):
+        for name in counter_words:
+            self.control[control_words.index(name)] = counters.get(name, 0)
+
+    def close(self):
+        self.control[control_words.index("closed")] = 1
+        del self.control, self.frames
+        self.shm.close()
+        self.shm.unlink()
+        self.lock.close(remove=True)
+        created_rings.discard(self.shm.name)
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    # consumers must not let the resource tracker unlink the producer's segment when they exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in created_rings:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class RingReader:
+    def __init__(self, name: str, from_start: bool = False):
+        self.shm = attach_shared_memory(name)
+        self.control = np.ndarray(len(control_words), dtype=np.int64, buffer=self.shm.buf)
+        self.schema = bytes(self.shm.buf[schema_offset:schema_offset + schema_size]).rstrip(b"\0").decode()
+        self.dtype = schemas[self.schema].dtype
+        self.capacity = int(self.control[control_words.index("capacity")])
+        self.frames = np.ndarray(self.capacity, dtype=self.dtype, buffer=self.shm.buf, offset=data_offset)
+        self.lock = RingLock(name)
+
+        # a new consumer starts at the live edge unless it asks for everything still in the ring
+        write_seq = self.write_seq()
+        self.cursor = max(write_seq - self.capacity, 0) if from_start else write_seq
+        self.view_start = self.cursor
+        self.overruns = 0
+        self.frames_lost = 0
+
+    def write_seq(self) -> int:
+        with self.lock:
+            return int(self.control[write_index])
+
+    def reserve_seq(self) -> int:
+        with self.lock:
+            return int(self.control[reserve_index])
+
+    def closed(self) -> bool:
+        return bool(self.control[control_words.index("closed")])
+
+    def counters(self) -> dict:
+        counters = {name: int(self.control[control_words.index(name)]) for name in counter_words}
+        counters.update(ring_overruns=self.overruns, ring_frames_lost=self.frames_lost)
+        return counters
+
+    def skip_overrun(self):
+        oldest = self.reserve_seq() - self.capacity
+        if self.cursor < oldest:
+            self.overruns += 1
+            self.frames_lost += oldest - self.cursor
+            self.cursor = oldest
+
+    def views(self, start: int, end: int) -> list:
+        first, last = start % self.capacity, end % self.capacity
+        if end - start == 0:
+            return []
+        if first < last:
+            return [self.frames[first:last]]
+        return [self.frames[first:], self.frames[:last]]
+
+    def read(self, max_frames: int = None, copy: bool = True):
+        # copy=False returns up to two views straight into shared memory; they stay valid until the producer
+        # laps them, which check_overrun() reports after the caller is done with them
+        # write_seq is loaded after reserve_seq, so it is never behind the cursor skip_overrun() moves to
+        self.skip_overrun()
+        write_seq = self.write_seq()
+        start = self.cursor
+        end = write_seq if max_frames is None else min(write_seq, start + max_frames)
+        views = self.views(start, end)
+        self.cursor = end
+        if not copy:
+            self.view_start = start
+            return views
+
+        frames = np.concatenate(views) if views else np.zeros(0, dtype=self.dtype)
+        # drop anything the producer overwrote or started overwriting while it was being copied
+        overwritten = self.reserve_seq() - self.capacity - start
+        if overwritten > 0:
+            self.overruns += 1
+            self.frames_lost += min(overwritten, len(frames))
+            frames = frames[overwritten:]
+        return frames
+
+    def check_overrun(self) -> bool:
+        overwritten = self.reserve_seq() - self.capacity - self.view_start
+        return overwritten > 0
+
+    def wait(self, timeout: float = None, max_frames: int = None) -> np.ndarray:
+        # polls until new frames are published, the producer closes, or timeout expires
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.write_seq() == self.cursor and not self.closed():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+        return self.read(max_frames)
+
+    def close(self):
+        del self.control, self.frames
+        self.shm.close()
+        self.lock.close()
@@ -0,0 +1,322 @@
+import collections
+import select
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from frame_schemas import frame_struct, schemas
+
+# Fan-out of decoded frames over TCP or UDP. Every message is a fixed header followed by a payload:
+#   hello  - sent once per subscriber, payload is the schema string ("<IfIf" / "<Iffff") of num_records bytes
+#   data   - payload is num_records raw wire records starting at sequence number first_seq
+#   dropped - no payload, num_records frames from first_seq were dropped because the subscriber fell behind
+# Publishing never blocks: each subscriber has a bounded queue and a slow subscriber loses whole chunks.
+
+telemetry_url_prefix = "tcp://"
+message_header = struct.Struct("<4sBxHIQ")     # magic, type, record size, num records, first sequence number
+message_magic = b"2DTM"
+hello_message, data_message, dropped_message = 0, 1, 2
+subscriber_queue_size = 64      # chunks buffered per subscriber before chunks are dropped
+udp_max_payload = 1408          # bytes of records per datagram, fits a standard Ethernet MTU
+udp_subscribe = b"SUBSCRIBE"
+udp_max_send_failures = 100     # consecutive failed sends before a UDP subscriber is dropped
+handshake_attempts = 5          # UDP subscribe datagrams sent before a client gives up waiting for hello
+
+
+def address_from_port(port: str):
+    # "tcp://host:port" -> (host, port), anything else -> None
+    if not port.startswith(telemetry_url_prefix):
+        return None
+    host, number = port[len(telemetry_url_prefix):].rsplit(":", 1)
+    return host, int(number)
+
+
+def encode_message(message_type: int, record_size: int, num_records: int, first_seq: int, payload: bytes = b""):
+    return message_header.pack(message_magic, message_type, record_size, num_records, first_seq) + payload
+
+
+class Subscriber:
+    def __init__(self, address, record_size: int):
+        self.address = address
+        self.record_size = record_size
+        self.queue = collections.deque()
+        self.ready = threading.Condition()
+        self.connected = True
+        self.pending_dropped = None     # (first_seq, num_records) not yet reported to the subscriber
+        self.send_failures = 0          # consecutive, UDP only
+
+        self.connected_time = time.monotonic()
+        self.chunks_sent = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.chunks_dropped = 0
+        self.frames_dropped = 0
+
+    def offer(self, message: bytes, first_seq: int, num_records: int):
+        with self.ready:
+            if len(self.queue) >= subscriber_queue_size:
+                self.chunks_dropped += 1
+                self.frames_dropped += num_records
+                if self.pending_dropped is None:
+                    self.pending_dropped = (first_seq, 0)
+                self.pending_dropped = (self.pending_dropped[0], self.pending_dropped[1] + num_records)
+                return
+            self.queue_dropped_notice()
+            self.queue.append((message, num_records))
+            self.ready.notify()
+
+    def queue_dropped_notice(self):
+        if self.pending_dropped is not None:
+            first_seq, num_records = self.pending_dropped
+            self.queue.append((encode_message(dropped_message, self.record_size, num_records, first_seq), 0))
+            self.pending_dropped = None
+
+    def next_message(self, timeout: float):
+        with self.ready:
+            if not self.queue:
+                # a drop is reported as soon as the backlog clears, even if nothing new has been published
+                self.queue_dropped_notice()
+            if not self.queue:
+                self.ready.wait(timeout)
+            return self.queue.popleft() if self.queue else None
+
+    def sent(self, message: bytes, num_records: int):
+        self.bytes_sent += len(message)
+        if num_records:
+            self.chunks_sent += 1
+            self.frames_sent += num_records
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.connected_time, 1e-9)
+        return {"address": self.address, "queue_depth": len(self.queue),
+                "chunks_sent": self.chunks_sent, "frames_sent": self.frames_sent, "bytes_sent": self.bytes_sent,
+                "bytes_per_second": self.bytes_sent / elapsed, "chunks_dropped": self.chunks_dropped,
+                "frames_dropped": self.frames_dropped}
+
+
+class TelemetryServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 5760, schema: str = frame_struct, udp: bool = False):
+        self.schema = schema
+        self.dtype = schemas[schema].dtype
+        self.udp = udp
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.running = True
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM if udp else socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        if udp:
+            # sends must never wait on a subscriber; accept_udp polls for subscriptions instead
+            self.sock.setblocking(False)
+        else:
+            self.sock.listen()
+            self.sock.settimeout(0.2)
+        threading.Thread(target=self.accept_udp if udp else self.accept_tcp, daemon=True).start()
+
+    def hello(self) -> bytes:
+        schema = self.schema.encode()
+        return encode_message(hello_message, self.dtype.itemsize, len(schema), self.seq, schema)
+
+    def accept_tcp(self):
+        while self.running:
+            try:
+                connection, address = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            subscriber = Subscriber(address, self.dtype.itemsize)
+            subscriber.queue.append((self.hello(), 0))
+            with self.lock:
+                self.subscribers.append(subscriber)
+            threading.Thread(target=self.send_tcp, args=(connection, subscriber), daemon=True).start()
+
+    def send_tcp(self, connection: socket.socket, subscriber: Subscriber):
+        try:
+            while self.running and subscriber.connected:
+                item = subscriber.next_message(0.2)
+                if item is not None:
+                    connection.sendall(item[0])
+                    subscriber.sent(*item)
+        except OSError:
+            pass
+        subscriber.connected = False
+        connection.close()
+        with self.lock:
+            self.subscribers.remove(subscriber)
+
+    def accept_udp(self):
+        while self.running:
+            try:
+                if not select.select([self.sock], [], [], 0.2)[0]:
+                    continue
+                data, address = self.sock.recvfrom(64)
+            except (BlockingIOError, ConnectionError):
+                # nothing to read after all, or an ICMP error from a gone subscriber reported on this socket
+                continue
+            except (OSError, ValueError):
+                break
+            if data != udp_subscribe:
+                continue
+            # a repeated subscribe means the client never got its hello, so it is sent again
+            with self.lock:
+                subscriber = next((s for s in self.subscribers if s.address == address), None)
+                if subscriber is None:
+                    subscriber = Subscriber(address, self.dtype.itemsize)
+                    self.subscribers.append(subscriber)
+            self.send_udp(subscriber, self.hello(), 0)
+
+    def send_udp(self, subscriber: Subscriber, message: bytes, num_records: int):
+        # a full send buffer or any socket error drops the datagram; a subscriber that keeps failing is removed
+        try:
+            self.sock.sendto(message, subscriber.address)
+        except OSError:
+            subscriber.chunks_dropped += 1
+            subscriber.frames_dropped += num_records
+            subscriber.send_failures += 1
+            if subscriber.send_failures >= udp_max_send_failures:
+                subscriber.connected = False
+                with self.lock:
+                    if subscriber in self.subscribers:
+                        self.subscribers.remove(subscriber)
+            return
+        subscriber.send_failures = 0
+        subscriber.sent(message, num_records)
+
+    def publish(self, frames: np.ndarray):
+        if not len(frames):
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if self.udp:
+            records_per_datagram = udp_max_payload // self.dtype.itemsize
+            for start in range(0, len(frames), records_per_datagram):
+                chunk = frames[start:start + records_per_datagram]
+                message = encode_message(data_message, self.dtype.itemsize, len(chunk), self.seq + start,
+                                         chunk.tobytes())
+                for subscriber in subscribers:
+                    self.send_udp(subscriber, message, len(chunk))
+        else:
+            message = encode_message(data_message, self.dtype.itemsize, len(frames), self.seq, frames.tobytes())
+            for subscriber in subscribers:
+                subscriber.offer(message, self.seq, len(frames))
+        self.seq += len(frames)
+
+    def stats(self) -> list:
+        with self.lock:
+            return [subscriber.stats() for subscriber in self.subscribers]
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+
+
+class TelemetryClient:
+    def __init__(self, host: str = "127.0.0.1", port: int = 5760, udp: bool = False, timeout: float = 1.0,
+                 read_timeout: float = None):
+        # timeout bounds the hello handshake (per subscribe attempt over UDP), read_timeout each read()
+        # afterwards and defaults to timeout
+        self.udp = udp
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM if udp else socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect((host, port))
+        self.buffer = b""
+        self.next_seq = None
+        self.frames_dropped = 0         # reported by the server as dropped for this subscriber
+        self.frames_missing = 0         # sequence gaps not covered by a notice (lost UDP datagrams)
+        self.resyncs = 0                # times the stream had to be searched for the next message
+        self.closed = False
+
+        message_type, _, _, _, payload = self.subscribe() if udp else self.receive_message()
+        if message_type != hello_message:
+            raise ValueError("Telemetry server did not start with a hello message")
+        self.schema = payload.decode()
+        self.dtype = schemas[self.schema].dtype
+        self.sock.settimeout(timeout if read_timeout is None else read_timeout)
+
+    def subscribe(self):
+        # the subscribe datagram or the hello can be lost, so subscribe is resent until a hello arrives; data
+        # reaching a client that is already subscribed does not count as an answer
+        for _ in range(handshake_attempts):
+            self.sock.send(udp_subscribe)
+            deadline = time.monotonic() + self.sock.gettimeout()
+            try:
+                while time.monotonic() < deadline:
+                    message = self.receive_message()
+                    if message[0] == hello_message:
+                        return message
+            except socket.timeout:
+                pass
+            except ConnectionRefusedError:
+                # nothing listening on the port yet
+                time.sleep(self.sock.gettimeout())
+        raise socket.timeout("Telemetry server did not answer the subscription with a hello message")
+
+    def fill_buffer(self, size: int):
+        while len(self.buffer) < size:
+            data = self.sock.recv(max(65536, size - len(self.buffer)))
+            if not data:
+                self.closed = True
+                raise ConnectionError("Telemetry server closed the connection")
+            self.buffer += data
+
+    def receive_message(self):
+        if self.udp:
+            # a datagram is a whole message; anything else on the socket is ignored
+            while True:
+                datagram = self.sock.recv(65536)
+                if len(datagram) >= message_header.size and datagram.startswith(message_magic):
+                    break
+                self.resyncs += 1
+            header, payload = datagram[:message_header.size], datagram[message_header.size:]
+            return message_header.unpack(header)[1:] + (payload,)
+
+        # nothing is taken out of the buffer until the whole message is in it, so a timeout part way through
+        # a message loses nothing and the next call carries on from the same header
+        resyncing = False
+        while True:
+            self.fill_buffer(message_header.size)
+            if self.buffer.startswith(message_magic):
+                break
+            # lost the message boundary: skip to the next magic, keeping a tail that could be the start of one
+            if not resyncing:
+                self.resyncs += 1
+                resyncing = True
+            index = self.buffer.find(message_magic, 1)
+            self.buffer = self.buffer[index:] if index >= 0 else self.buffer[1 - len(message_magic):]
+        _, message_type, record_size, num_records, first_seq = message_header.unpack_from(self.buffer)
+        payload_size = {hello_message: num_records, data_message: record_size * num_records}.get(message_type, 0)
+        end = message_header.size + payload_size
+        self.fill_buffer(end)
+        payload, self.buffer = self.buffer[message_header.size:end], self.buffer[end:]
+        return message_type, record_size, num_records, first_seq, payload
+
+    def read(self) -> np.ndarray:
+        # blocks for the next data message; returns an empty array on timeout
+        while True:
+            try:
+                message_type, _, num_records, first_seq, payload = self.receive_message()
+            except socket.timeout:
+                return np.zeros(0, dtype=self.dtype)
+            if message_type == dropped_message:
+                self.frames_dropped += num_records
+                self.next_seq = first_seq + num_records
+            elif message_type == data_message:
+                if self.next_seq is not None and first_seq > self.next_seq:
+                    self.frames_missing += first_seq - self.next_seq
+                self.next_seq = first_seq + num_records
+                return np.frombuffer(payload, dtype=self.dtype)
+
+    def counters(self) -> dict:
+        # same keys as FrameValidator.counters(); frames lost between server and subscriber count as dropped
+        return {"dropped_frames": self.frames_dropped + self.frames_missing, "resyncs": self.resyncs,
+                "out_of_order": 0, "telemetry_frames_dropped": self.frames_dropped,
+                "telemetry_frames_missing": self.frames_missing}
+
+    def close(self):
+        self.sock.close()
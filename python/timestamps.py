@@ -0,0 +1,33 @@
+import numpy as np
+
+# Teensy micros() is a uint32 and wraps every 2**32 us (~71.6 min). A backwards step of more than half
+# the range can only be a wrap; smaller backwards steps are left alone as out-of-order samples.
+wrap_period = 2 ** 32
+wrap_threshold = 2 ** 31
+
+
+def unwrap_timestamps(timestamps: np.ndarray, offset: int = 0) -> np.ndarray:
+    # vectorized; already unwrapped int64 input passes through unchanged
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if not len(timestamps):
+        return timestamps
+    wraps = np.cumsum(np.diff(timestamps, prepend=timestamps[0]) < -wrap_threshold)
+    return timestamps + offset + wraps * wrap_period
+
+
+class TimestampUnwrapper:
+    # carries the wrap count across chunk boundaries while streaming
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+        self.last = None
+
+    def unwrap(self, timestamps: np.ndarray) -> np.ndarray:
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if not len(timestamps):
+            return timestamps
+        previous = timestamps[0] if self.last is None else self.last
+        wraps = np.cumsum(np.diff(timestamps, prepend=previous) < -wrap_threshold)
+        unwrapped = timestamps + self.offset + wraps * wrap_period
+        self.offset += int(wraps[-1]) * wrap_period
+        self.last = int(timestamps[-1])
+        return unwrapped
@@ -0,0 +1,75 @@
+import sys
+import time
+import numpy as np
+from scipy.signal import find_peaks
+
+# Object velocity from a position trace driven by a periodic waveform. Every estimator takes the sample
+# times in seconds (which may be non-uniform or contain pauses), the positions, and the waveform frequency,
+# and returns an array of velocity estimates in position units per second, so callers can swap estimators
+# and take the mean / std of whichever they use.
+
+
+def cycle_peak_distance(spacing: float, frequency: float) -> int:
+    # minimum distance in samples between waveform peaks for a sample spacing in seconds
+    return max(int(round(1 / (frequency * spacing))), 1)
+
+
+def find_cycle_peaks(times: np.ndarray, positions: np.ndarray, frequency: float) -> np.ndarray:
+    # at most one peak per waveform period; the minimum peak distance in samples comes from the median
+    # sample spacing, so pauses in the capture do not shrink it
+    spacing = np.median(np.diff(times)) if len(times) > 1 else 1.0
+    return find_peaks(positions, distance=cycle_peak_distance(spacing, frequency))[0]
+
+
+def period_window_velocities(times: np.ndarray, positions: np.ndarray, frequency: float) -> np.ndarray:
+    # displacement over one waveform period starting at every sample: each sample is paired with the first
+    # sample at least one period later (one searchsorted over all samples) and divided by the actual time
+    # between them; samples less than a period from the end have no partner
+    times = np.asarray(times, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    ends = np.searchsorted(times, times + 1 / frequency)
+    num_windows = int(np.searchsorted(ends, len(times)))     # ends never decrease
+    ends = ends[:num_windows]
+    starts = np.arange(num_windows)
+    return (positions[ends] - positions[starts]) / (times[ends] - times[starts])
+
+
+def peak_to_peak_velocities(times: np.ndarray, positions: np.ndarray, frequency: float) -> np.ndarray:
+    # one estimate per cycle: rise between consecutive waveform peaks over the time between them
+    peaks = find_cycle_peaks(times, positions, frequency)
+    return np.diff(np.asarray(positions, dtype=np.float64)[peaks]) / np.diff(np.asarray(times)[peaks])
+
+
+def peak_fit_velocities(times: np.ndarray, positions: np.ndarray, frequency: float) -> np.ndarray:
+    # least-squares slope of position against time over the waveform peaks, as a single estimate
+    peaks = find_cycle_peaks(times, positions, frequency)
+    if len(peaks) < 2:
+        return np.zeros(0)
+    peak_times = np.asarray(times, dtype=np.float64)[peaks]
+    peak_positions = np.asarray(positions, dtype=np.float64)[peaks]
+    peak_times = peak_times - peak_times.mean()
+    slope = np.dot(peak_times, peak_positions - peak_positions.mean()) / np.dot(peak_times, peak_times)
+    return np.array([slope])
+
+
+estimators = {
+    "period": period_window_velocities,
+    "peaks": peak_to_peak_velocities,
+    "peak_fit": peak_fit_velocities,
+}
+
+
+if __name__ == "__main__":
+    # timing on a synthetic stick-slip trace: 2 kHz with jitter and a pause, drifting at 5 mm/s
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    frequency = 20
+    rng = np.random.default_rng(0)
+    times = np.cumsum(rng.uniform(0.0004, 0.0006, num_samples))
+    times[num_samples // 2:] += 1.0
+    positions = 5 * times + 0.5 * np.sin(2 * np.pi * frequency * times)
+
+    for name, estimator in estimators.items():
+        start = time.perf_counter()
+        velocities = estimator(times, positions, frequency)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10}{len(velocities):>10} estimates, mean {velocities.mean():.3f} mm/s in {elapsed:.3f} s")
@@ -1,10 +1,11 @@
 import matplotlib.pyplot as plt
 from matplotlib.patches import FancyBboxPatch
-from scipy.signal import find_peaks
-import pandas as pd
 import numpy as np
+from batch_runner import run_batch
+from capture_files import unwrapped_timestamps
+from capture_loader import load_capture
+from velocity_estimators import find_cycle_peaks, peak_to_peak_velocities, period_window_velocities
 
-sampling_frequency = 2000
 waveform_frequency = 20    # Hz
 waveform_period = 1 / waveform_frequency
 
@@ -23,9 +24,15 @@ def varying_amax_analysis(plot: bool = False):
     target_forces = np.array([50, 48, 46, 44, 42, 40, 38, 36, 34, 32, 30])
     amax_values = [5, 10, 15, 20]
 
-    for amax, c in zip(amax_values, colors):
-        filename = "data/object_velocity_varying_amax_normal_force/frequency_20_amin_0.7_amax_" + str(amax) + ".csv"
-        _, mean_velocities, std_velocities = read_data(filename, plot=plot)
+    # each file is analysed once for both figures, one per worker (in this process when plotting)
+    filenames = ["data/object_velocity_varying_amax_normal_force/frequency_20_amin_0.7_amax_" + str(amax) + ".csv"
+                 for amax in amax_values]
+    results = run_batch(read_data, filenames, workers=1 if plot else None, plot=plot, amax=True)
+
+    for amax, c, result in zip(amax_values, colors, results):
+        if not result.ok:
+            continue
+        _, mean_velocities, std_velocities = result.value
         plt.plot(target_forces, mean_velocities, color=c, linestyle='-',
                  linewidth=4, label=r'$a_{{slip}} = {:.0f}\:g$'.format(amax))
         # Plot shaded region for standard deviation
@@ -46,8 +53,6 @@ def varying_amax_analysis(plot: bool = False):
     aspect_ratio = 1/4
     ax.set_aspect(aspect_ratio, adjustable='box')
 
-    amax_values = [5, 10, 15, 20]
-
     n_series = len(amax_values)
     force_spacing = np.min(np.diff(np.sort(target_forces)))
     group_width = 0.9 * force_spacing   # still leave margin between groups
@@ -58,9 +63,10 @@ def varying_amax_analysis(plot: bool = False):
 
     all_y = []  # collect all bar heights
 
-    for i, (amax, c) in enumerate(zip(amax_values, colors)):
-        filename = f"data/object_velocity_varying_amax_normal_force/frequency_20_amin_0.7_amax_" + str(amax) + ".csv"
-        _, mean_velocities, std_velocities = read_data(filename, plot=plot, amax=True)
+    for i, (amax, c, result) in enumerate(zip(amax_values, colors, results)):
+        if not result.ok:
+            continue
+        _, mean_velocities, std_velocities = result.value
 
         x_positions = target_forces - group_width/2 + (i + 0.5) * (group_width / n_series)
 
@@ -136,9 +142,14 @@ def varying_amin_analysis(plot: bool = False):
 
     all_y = []  # collect all bar heights
 
-    for i, (amin, c) in enumerate(zip(amin_values, colors)):
-        filename = f"data/object_velocity_varying_amin_normal_force/frequency_15_amin_{amin}_amax_10.csv"
-        _, mean_velocities, _ = read_data(filename, plot=plot, amax=False)
+    filenames = [f"data/object_velocity_varying_amin_normal_force/frequency_15_amin_{amin}_amax_10.csv"
+                 for amin in amin_values]
+    results = run_batch(read_data, filenames, workers=1 if plot else None, plot=plot, amax=False)
+
+    for i, (amin, c, result) in enumerate(zip(amin_values, colors, results)):
+        if not result.ok:
+            continue
+        _, mean_velocities, _ = result.value
 
         # x_positions = target_forces - group_width/2 + (i + 0.5) * bar_width
         x_positions = target_forces - group_width/2 + (i + 0.5) * (group_width / n_series)
@@ -196,81 +207,66 @@ def varying_amin_analysis(plot: bool = False):
     plt.show()
 
 
+def segment_experiments(positions: np.ndarray, reset_drop: float = position_reset) -> np.ndarray:
+    # (start, end) offsets of each experiment in one capture; a new experiment starts wherever the position
+    # drops by more than reset_drop from one sample to the next (the part was put back at the start)
+    resets = np.flatnonzero(np.diff(positions) < -reset_drop) + 1
+    bounds = np.r_[0, resets, len(positions)]
+    return np.column_stack((bounds[:-1], bounds[1:]))
+
+
+def first_crossing(positions: np.ndarray, threshold: float, default: int) -> int:
+    # first index at or above threshold; positions oscillate, so this is argmax on the mask rather than searchsorted
+    above = positions >= threshold
+    index = int(np.argmax(above))
+    return index if above[index] else default
+
+
 def read_data(filename: str, plot: bool = False, amax: bool = True):
-    mean_forces = []
     mean_velocities = []
     std_velocities = []
 
-    logged_data = pd.read_csv(filename)
-    reset_indices = logged_data.index[logged_data['position'].diff() < -position_reset].tolist()
-
-    # # Add start and end indices to define experiment segments
-    exp_indices = [0] + reset_indices + [len(logged_data)]
-
-    experiments = []
-    for i in range(len(exp_indices) - 1):
-        start, end = exp_indices[i], exp_indices[i+1]
-        experiments.append(logged_data.iloc[int(start):int(end)].reset_index(drop=True))
+    header, frames = load_capture(filename)
+    position_timestamps = unwrapped_timestamps(header, frames, "position_timestamp")
+    force_timestamps = unwrapped_timestamps(header, frames, "force_timestamp")
+    positions = frames["position"]
+    forces = frames["force"]
 
+    segments = segment_experiments(positions)
     if amax:
-        experiments = experiments[:11]
+        segments = segments[:11]
     else:
-        experiments = experiments[:3]
+        segments = segments[:3]
 
-    for i, exp in enumerate(experiments, 1):
-        # Time in seconds (relative)
-        exp['position_timestamp'] -= exp['position_timestamp'].iloc[0]
-        exp['force_timestamp'] -= exp['force_timestamp'].iloc[0]
+    # Average force of every experiment in one pass
+    starts, ends = segments[:, 0], segments[:, 1]
+    mean_forces = -np.add.reduceat(forces, starts, dtype=np.float64) / (ends - starts)
+    if len(segments) and ends[-1] < len(forces):
+        # reduceat runs the last segment to the end of the array; redo it over its own range
+        mean_forces[-1] = -forces[starts[-1]:ends[-1]].mean(dtype=np.float64)
 
-        # Average force
-        avg_force = -exp['force'].mean()
+    for i, (start, end) in enumerate(segments, 1):
+        exp_positions = positions[start:end]
 
         # --- Step 3: Peak detection ---
-        # Find first index where position crosses lower threshold
-        lower_mask = exp['position'] >= lower_position_threshold
-        if lower_mask.any():
-            first_lower_idx = lower_mask.idxmax()  # first True index
-        else:
-            first_lower_idx = 0
-
-        # Find first index where position crosses upper threshold
-        upper_mask = exp['position'] >= upper_position_threshold
-        if upper_mask.any():
-            first_upper_idx = upper_mask.idxmax()  # first True index
-        else:
-            first_upper_idx = len(exp['position'])
-
-        # Extract subset between these indices
-        subset = exp.loc[first_lower_idx:first_upper_idx]
+        # First index where position crosses the lower and upper thresholds; the subset keeps the upper sample
+        first_lower_idx = first_crossing(exp_positions, lower_position_threshold, 0)
+        first_upper_idx = first_crossing(exp_positions, upper_position_threshold, len(exp_positions))
+        subset = slice(first_lower_idx, first_upper_idx + 1)
 
-        t = subset['position_timestamp'] * 1e-6
-        x = subset['position']
+        # Time in seconds (relative)
+        t = (position_timestamps[start:end][subset] - position_timestamps[start]) * 1e-6
+        x = exp_positions[subset]
 
         if calculate_velocity_using_peaks:
-            peak_indices, _ = find_peaks(x, distance=sampling_frequency / waveform_frequency)
+            # --- per-cycle velocities between consecutive peaks ---
+            velocities = peak_to_peak_velocities(t, x, waveform_frequency)
 
-            if len(peak_indices) < 2:
+            if len(velocities) < 1:
                 raise ValueError("Not enough peaks found to compute velocities.")
-
-            # --- per-cycle velocities between consecutive peaks ---
-            t_peaks = t.iloc[peak_indices]
-            x_peaks = x.iloc[peak_indices]
-            dt = np.diff(t_peaks)        # s between peaks
-            dx = np.diff(x_peaks)        # mm rise between peaks
-            velocities = dx / dt                 # mm/s for each cycle
         else:
-            # Loop through each point
-            for j in range(len(t)):
-                # Find the index of the point period ahead
-                target_time = t.iloc[j] + waveform_period
-                # Find the closest index
-                k = np.searchsorted(t, target_time)
-                if k < len(t):
-                    # Velocity estimate
-                    v = (x.iloc[k] - x.iloc[j]) / (t.iloc[k] - t.iloc[j])
-                    velocities.append(v)
-
-        velocities = np.array(velocities)
+            # velocity over one waveform period starting at every sample
+            velocities = period_window_velocities(t, x, waveform_frequency)
 
         # Compute mean and standard deviation
         avg_velocity = np.mean(velocities)
@@ -279,34 +275,35 @@ def read_data(filename: str, plot: bool = False, amax: bool = True):
         # print("Average velocity: {:.2f} ± {:.2f} mm/s".format(avg_velocity, std_velocity))
         # print("Average velocity: {:.2f} mm/s".format(avg_velocity))
 
-        mean_forces.append(avg_force)
         mean_velocities.append(avg_velocity)
         std_velocities.append(std_velocity)
 
         if plot:
-            plot_data(t, x, exp, i, peak_indices)
+            plot_data(t, x, (position_timestamps[start:end] - position_timestamps[start]) * 1e-6, exp_positions,
+                      (force_timestamps[start:end] - force_timestamps[start]) * 1e-6, forces[start:end], i,
+                      find_cycle_peaks(t, x, waveform_frequency))
 
     return np.asarray(mean_forces), np.asarray(mean_velocities), np.asarray(std_velocities)
 
     # return position_timestamps, part_positions, force_timestamps, forces
 
 
-def plot_data(t, x, exp, i, peak_indices):
+def plot_data(t, x, exp_times, exp_positions, exp_force_times, exp_forces, i, peak_indices):
     # --- Plot ---
     _, ax1 = plt.subplots(figsize=(7, 4))
 
     # Position (left y-axis)
     ax1.plot(t, x, 'b-', label="Position (mm)")
-    ax1.plot(exp['position_timestamp'] * 1e-6, exp['position'], 'b-', alpha=0.3, label="Position (mm)")
-    ax1.scatter(t.iloc[peak_indices], x.iloc[peak_indices], c='k')
+    ax1.plot(exp_times, exp_positions, 'b-', alpha=0.3, label="Position (mm)")
+    ax1.scatter(t[peak_indices], x[peak_indices], c='k')
     ax1.set_xlabel("Time (s)")
     ax1.set_ylabel("Position (mm)", color='b')
     ax1.tick_params(axis='y', labelcolor='b')
 
     # Force (right y-axis)
-    avg_force = -exp['force'].mean()
+    avg_force = -exp_forces.mean(dtype=np.float64)
     ax2 = ax1.twinx()
-    ax2.plot(exp['force_timestamp'] * 1e-6, -exp['force'], 'r-', label="Force (N)")
+    ax2.plot(exp_force_times, -exp_forces, 'r-', label="Force (N)")
     ax2.axhline(avg_force, color='r', linestyle='--',
                 label=f"Avg Force = {avg_force:.2f}")
     ax2.set_ylabel("Force (N)", color='r')
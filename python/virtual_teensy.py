@@ -0,0 +1,205 @@
+import argparse
+import os
+import select
+import threading
+import time
+import tty
+import numpy as np
+import pandas as pd
+from capture_files import capture_extension, read_capture
+from frame_schemas import frame_struct, schemas
+from frame_sync import FrameValidator, max_gap_us
+
+# Stand-in for a Teensy on USB: a pty pair whose slave end can be opened with serial.Serial like a real
+# port. Recorded captures are re-encoded into firmware frames and streamed at their original cadence.
+
+tick = 0.001                # s between writes to the pty
+
+# Logger captures have no motor channels; when replaying them as plotter frames the object position
+# stands in for motor 1 and the force for motor 2, and micros() timestamps are converted to millis().
+plot_columns_from_log = {"timestamp": "position_timestamp",
+                         "motor_1_target_position": "position", "motor_1_actual_position": "position",
+                         "motor_2_target_position": "force", "motor_2_actual_position": "force"}
+
+
+def encode_capture(filename: str, schema: str = frame_struct) -> np.ndarray:
+    dtype = schemas[schema].dtype
+    if filename.endswith(capture_extension):
+        _, recorded = read_capture(filename)
+        columns = recorded.dtype.names
+    else:
+        recorded = pd.read_csv(filename)
+        columns = recorded.columns
+
+    frames = np.empty(len(recorded), dtype=dtype)
+    for name in dtype.names:
+        if name in columns:
+            frames[name] = recorded[name]
+        elif name == "timestamp":
+            frames[name] = np.asarray(recorded[plot_columns_from_log[name]], dtype=np.int64) // 1000
+        else:
+            frames[name] = recorded[plot_columns_from_log[name]]
+
+    # a 2 kHz log maps several samples onto each millisecond; keep the first, as the 1 kHz PLOT build would
+    if "timestamp" not in columns and "timestamp" in dtype.names:
+        frames = frames[np.r_[True, np.diff(frames["timestamp"].astype(np.int64)) != 0]]
+    return frames
+
+
+class VirtualTeensy:
+    def __init__(self, filename: str, schema: str = frame_struct, speed: float = 1.0, loop: bool = False,
+                 restamp: bool = False):
+        # speed is a multiple of real time, 0 streams as fast as the reader drains the pty
+        self.frames = encode_capture(filename, schema)
+        self.schema = schema
+        self.speed = speed
+        self.loop = loop
+        self.restamp = restamp
+        self.running = False
+        self.thread = None
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        # recorded ticks since the first frame, unwrapped; frames are sent at their offset in seconds
+        timestamps = self.frames[self.frames.dtype.names[0]].astype(np.int64)
+        self.send_ticks = np.cumsum(np.r_[0, np.diff(timestamps) & 0xFFFFFFFF])
+        self.send_times = self.send_ticks / schemas[schema].timestamps_per_second
+
+        self.frames_sent = 0
+        self.start_time = None
+        self.last_stamp = None          # host-clock ticks of the last restamped frame, kept across loops
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.stream, daemon=True)
+        self.thread.start()
+        return self
+
+    def stream(self):
+        self.start_time = time.monotonic()
+        index = 0
+        while self.running:
+            if self.speed > 0:
+                elapsed = (time.monotonic() - self.start_time) * self.speed
+                end = int(np.searchsorted(self.send_times, elapsed, side="right"))
+            else:
+                end = min(index + 1024, len(self.frames))
+
+            if end > index:
+                chunk = self.frames[index:end]
+                if self.restamp:
+                    chunk = self.restamped(chunk, index)
+                os.write(self.master_fd, chunk.tobytes())
+                self.frames_sent += end - index
+                index = end
+
+            if index >= len(self.frames):
+                if not self.loop:
+                    break
+                index = 0
+                self.start_time = time.monotonic()
+
+            if self.speed > 0:
+                time.sleep(tick)
+
+        self.running = False
+
+    def restamped(self, chunk: np.ndarray, index: int) -> np.ndarray:
+        # moves chunk (frames index onwards) onto the host monotonic clock at the time of sending. The recorded
+        # spacing within the chunk is kept, and every timestamp column of a frame is shifted by the same amount
+        # so e.g. force_timestamp stays next to position_timestamp. A chunk starts one recorded step after the
+        # previous one, or up to a quarter frame later to follow the host clock: timestamps keep increasing when
+        # sends run ahead of the clock (speed 0) and across a loop back to the first frame, and late wakeups of
+        # the stream thread never show up as dropped frames.
+        schema = schemas[self.schema]
+        base = time.monotonic_ns() // int(1e9 // schema.timestamps_per_second)
+        if self.last_stamp is not None:
+            step = self.send_ticks[index] - self.send_ticks[index - 1] if index else schema.frame_spacing
+            expected = self.last_stamp + int(step)
+            base = min(max(base, expected), expected + schema.frame_spacing // 4)
+        stamps = base + self.send_ticks[index:index + len(chunk)] - self.send_ticks[index]
+        shift = stamps - chunk[chunk.dtype.names[0]].astype(np.int64)
+        chunk = chunk.copy()
+        for name in schema.timestamp_columns():
+            chunk[name] = (chunk[name].astype(np.int64) + shift) & 0xFFFFFFFF
+        self.last_stamp = int(stamps[-1])
+        return chunk
+
+    def frame_rate(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        return self.frames_sent / max(time.monotonic() - self.start_time, 1e-9)
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def stop(self):
+        self.running = False
+        self.wait()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def check_restamp(filename: str, schema: str = frame_struct, speed: float = 1.0, seconds: float = 3.0) -> dict:
+    # streams a looping, restamped replay for the given time into the FrameValidator the logger uses and
+    # returns its counters along with the number of frames sent; a good stream has every frame valid and
+    # nothing dropped, skipped or out of order (pauses in the recording are replayed as pauses)
+    frame_schema = schemas[schema]
+    device = VirtualTeensy(filename, schema, speed, loop=True, restamp=True)
+    # the recorded cadence, which differs from the schema's when e.g. a 500 Hz log is replayed as PLOT frames
+    validator = FrameValidator(frame_schema.dtype, float(np.median(np.diff(device.send_ticks))),
+                               max_gap_us * frame_schema.timestamps_per_second / 1e6)
+    device.start()
+    end_time = time.monotonic() + seconds
+    while True:
+        if time.monotonic() >= end_time:
+            # keep draining until the stream thread is done, it may be blocked writing to a full pty
+            device.running = False
+        if select.select([device.slave_fd], [], [], 0.05)[0]:
+            validator.feed(os.read(device.slave_fd, 65536))
+        elif not device.thread.is_alive():
+            break
+    validator.flush()
+    device.stop()
+    return {"frames_sent": device.frames_sent, **validator.counters()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded capture as a virtual Teensy serial port")
+    parser.add_argument("filename", help="CSV or .bin capture to replay")
+    parser.add_argument("--schema", default=frame_struct, choices=list(schemas),
+                        help="wire format to encode (<IfIf logger frames or <Iffff plotter frames)")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of real time, 0 for as fast as possible")
+    parser.add_argument("--loop", action="store_true", help="restart from the beginning when the capture ends")
+    parser.add_argument("--restamp", action="store_true",
+                        help="replace timestamps with the host monotonic clock so readers can measure latency")
+    parser.add_argument("--check", type=float, metavar="SECONDS",
+                        help="stream a looping, restamped replay into a FrameValidator for SECONDS and report it")
+    args = parser.parse_args()
+
+    if args.check is not None:
+        counters = check_restamp(args.filename, args.schema, args.speed, args.check)
+        print(", ".join(f"{name} {value}" for name, value in counters.items()))
+        good = (counters["frames_valid"] == counters["frames_sent"] and not counters["dropped_frames"]
+                and not counters["bytes_skipped"] and not counters["out_of_order"])
+        print("ok" if good else "MISMATCH")
+        raise SystemExit(0 if good else 1)
+
+    device = VirtualTeensy(args.filename, args.schema, args.speed, args.loop, args.restamp).start()
+    print(f"Streaming {len(device.frames)} {args.schema} frames on {device.port}. Press Ctrl+C to stop.")
+    try:
+        while device.running:
+            time.sleep(1)
+            print(f"{device.frames_sent} frames sent, {device.frame_rate():.0f} frames/s")
+    except KeyboardInterrupt:
+        pass
+    device.stop()